@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+from time import perf_counter
+
+import numpy as np
+
+from uncon_optimizer import uncon_optimizer
+
+
+def batch_bfgs(func, x0, epsilon_g, args=(), options=None):
+    """
+    BFGS on a stack of independent problems of the same size, advanced together so the python
+    overhead is paid once per step instead of once per problem. Each problem keeps its own
+    inverse hessian (a (B, n, n) array), backtracking step and convergence flag, and only the
+    problems that still need it are evaluated.
+
+    func(X, *args) takes X of shape (n, k), one point per column like the other vectorized
+    objectives and FevWrapper, and returns f of shape (k,) and g of shape (n, k).
+    args are per problem parameters with a leading dimension of B, they are sliced along with X
+    so func always sees the parameters of the points it gets.
+    x0 is (B, n), or (n,) to start every problem from the same point.
+
+    options:
+    - max_iter: iterations before giving up on the problems still running.
+    - suffdec: sufficient decrease constant of the backtracking line search.
+    - bktrk: backtracking factor.
+    - max_bktrk: backtracks before a problem takes its last step anyway.
+
+    Returns x (B, n), f (B,) and an output dict with
+    - iterations: iterations each problem took.
+    - converged: whether each problem reached epsilon_g.
+    - infnorm: final gradient infinity norm of each problem.
+    - calls: calls to func, each one for part of the batch.
+    - fev: evaluations of each problem.
+    """
+    if options is None:
+        options = {}
+    if "max_iter" not in options:
+        options["max_iter"] = 1000
+    if "suffdec" not in options:
+        options["suffdec"] = 1e-4
+    if "bktrk" not in options:
+        options["bktrk"] = 0.5
+    if "max_bktrk" not in options:
+        options["max_bktrk"] = 30
+
+    args = [np.asarray(arg) for arg in args]
+    x = np.array(x0, dtype=float)
+    if x.ndim == 1:
+        x = np.tile(x, (len(args[0]) if args else 1, 1))
+    n_prob, n = x.shape
+    calls = 0
+    fev = np.zeros(n_prob, dtype=int)
+
+    def evaluate(idx, X):
+        nonlocal calls
+        calls += 1
+        fev[idx] += 1
+        # x and g are kept one problem per row here, func gets and returns them as columns
+        f, g = func(X.T, *[arg[idx] for arg in args])
+        return np.asarray(f, dtype=float), np.asarray(g, dtype=float).T
+
+    f, g = evaluate(np.arange(n_prob), x)
+    infnorm = np.max(np.abs(g), axis=1)
+    # scaled identity to start, like dir_bfgs
+    inv_hess = np.eye(n) / np.linalg.norm(g, axis=1)[:, None, None]
+    iterations = np.zeros(n_prob, dtype=int)
+    converged = infnorm <= epsilon_g
+    # indices of the problems still iterating
+    active = np.flatnonzero(~converged)
+
+    for it in range(options["max_iter"]):
+        if active.size == 0:
+            break
+        x_a, f_a, g_a = x[active], f[active], g[active]
+        dir = -np.einsum('kij,kj->ki', inv_hess[active], g_a)
+        dphi_0 = np.einsum('ki,ki->k', g_a, dir)
+
+        # backtracking from the full step, each round only evaluates the problems still searching
+        step = np.ones(active.size)
+        f_new = np.empty(active.size)
+        g_new = np.empty_like(g_a)
+        pending = np.arange(active.size)
+        for bk in range(options["max_bktrk"] + 1):
+            x_try = x_a[pending] + step[pending, None]*dir[pending]
+            f_try, g_try = evaluate(active[pending], x_try)
+            ok = f_try <= f_a[pending] + options["suffdec"]*step[pending]*dphi_0[pending]
+            if bk == options["max_bktrk"]:
+                ok[:] = True
+            f_new[pending[ok]] = f_try[ok]
+            g_new[pending[ok]] = g_try[ok]
+            pending = pending[~ok]
+            if pending.size == 0:
+                break
+            step[pending] *= options["bktrk"]
+
+        s = step[:, None]*dir
+        y = g_new - g_a
+        # armijo alone doesn't guarantee s.y > 0, those problems keep their inverse hessian
+        sy = np.einsum('ki,ki->k', s, y)
+        update = sy > 1e-10*np.linalg.norm(s, axis=1)*np.linalg.norm(y, axis=1)
+        upd = active[update]
+        sigma = 1/sy[update]
+        s_u, y_u = s[update], y[update]
+        eye = np.eye(n)
+        left = eye - sigma[:, None, None]*np.einsum('ki,kj->kij', s_u, y_u)
+        inv_hess[upd] = left @ inv_hess[upd] @ left.transpose(0, 2, 1) + \
+            sigma[:, None, None]*np.einsum('ki,kj->kij', s_u, s_u)
+
+        x[active] = x_a + s
+        f[active] = f_new
+        g[active] = g_new
+        iterations[active] += 1
+        infnorm[active] = np.max(np.abs(g_new), axis=1)
+        done = infnorm[active] <= epsilon_g
+        converged[active[done]] = True
+        active = active[~done]
+
+    output = {
+        'iterations': iterations,
+        'converged': converged,
+        'infnorm': infnorm,
+        'calls': calls,
+        'fev': fev,
+    }
+    return x, f, output
+
+
+# rosenbrock with its constants as parameters, the minimum is at (a, a^2)
+def rosenbrock_ab(X, a, b):
+    t = X[1] - X[0]**2
+    f = (a - X[0])**2 + b*t**2
+    g = np.array([-2*(a - X[0]) - 4*b*X[0]*t, 2*b*t])
+    return f, g
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    n_prob = 5000
+    a = rng.uniform(0.5, 1.5, n_prob)
+    b = rng.uniform(10, 100, n_prob)
+
+    start = perf_counter()
+    x, f, output = batch_bfgs(rosenbrock_ab, np.zeros(2), 1e-6, args=(a, b))
+    elapsed = perf_counter() - start
+    error = np.max(np.abs(x - np.column_stack([a, a**2])))
+    print(f"batch: {n_prob} problems in {elapsed:.2f} s, converged: {np.all(output['converged'])}, "
+          f"max error: {error:.1e}, mean iterations: {np.mean(output['iterations']):.1f}, calls: {output['calls']}")
+
+    # one uncon_optimizer run per problem on a slice of the batch
+    n_loop = 200
+    start = perf_counter()
+    for k in range(n_loop):
+        def func(xk): return tuple(v[..., 0] for v in rosenbrock_ab(xk[:, None], a[k], b[k]))
+        uncon_optimizer(func, np.zeros(2), 1e-6, {"direction": "bfgs", "history": False})
+    elapsed_loop = perf_counter() - start
+    print(f"loop: {n_loop} problems in {elapsed_loop:.2f} s, "
+          f"about {elapsed_loop/n_loop*n_prob:.1f} s for all {n_prob}")
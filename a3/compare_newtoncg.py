@@ -0,0 +1,46 @@
+from time import perf_counter
+
+import numpy as np
+
+import not_tests_uncon_optimizer as tw
+from uncon_optimizer import uncon_optimizer
+
+
+def rosenbrock_nd_hessvec(x, v):
+    """
+    Hessian of the n dimensional rosenbrock function times v, the hessian is tridiagonal
+    so this costs about as much as the gradient and is never formed.
+    """
+    x = np.asarray(x, dtype=float)
+    diag = np.zeros_like(x)
+    diag[:-1] = 1200*x[:-1]**2 - 400*x[1:] + 2
+    diag[1:] += 200
+    off = -400*x[:-1]
+    hv = diag*v
+    hv[:-1] += off*v[1:]
+    hv[1:] += off*v[:-1]
+    return hv
+
+
+def run(options, dims):
+    func = tw.FunctionWrapperWithCounter(tw.func_rosenbrock_nd)
+    func._max_fcalls = np.inf
+    start = perf_counter()
+    _, _, output = uncon_optimizer(func, np.zeros(dims), 1e-6, {"history": False, **options})
+    elapsed = perf_counter() - start
+    return output['iterations'], output.get('cg_iterations', '-'), func.get_fcalls(), elapsed
+
+
+if __name__ == '__main__':
+    # the dense inverse hessian update of bfgs is O(n^3) per iteration (about 4 minutes at
+    # n = 1000) and 800 MB at n = 10^4, so it only runs at the smallest size
+    methods = [("bfgs", {"direction": "bfgs"}, 1000),
+               ("newtoncg, exact Hv", {"direction": "newtoncg", "hessvec": rosenbrock_nd_hessvec}, 10000),
+               ("newtoncg, fd Hv", {"direction": "newtoncg", "hessvec": "fd"}, 10000)]
+    print(f"{'method':20}{'dims':>8}{'iters':>8}{'Hv':>8}{'fcalls':>8}{'time':>10}")
+    for dims in [1000, 3000, 10000]:
+        for name, options, max_dims in methods:
+            if dims > max_dims:
+                continue
+            iters, hv, fcalls, elapsed = run(options, dims)
+            print(f"{name:20}{dims:>8}{iters:>8}{hv:>8}{fcalls:>8}{elapsed:>9.2f}s")
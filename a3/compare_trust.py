@@ -0,0 +1,35 @@
+import numpy as np
+
+import not_tests_uncon_optimizer as tw
+from uncon_optimizer import uncon_optimizer
+
+
+def run(func_in, x0, options):
+    func = tw.FunctionWrapperWithCounter(func_in)
+    xopt, _, output = uncon_optimizer(func, x0, 1e-6, dict(options))
+    converged = np.max(np.abs(func_in(xopt)[1])) <= 1e-6
+    return output['iterations'], func.get_fcalls(), converged
+
+
+if __name__ == '__main__':
+    # the TestsYouMustPass problems with their start points
+    tw.set_dims(64)
+    problems = [("slanted quad", tw.func_slanted_quad, np.array([0., 3.])),
+                ("bean", tw.func_bean, np.zeros(2)),
+                ("rosenbrock", tw.func_rosenbrock, np.zeros(2)),
+                ("rosenbrock 64d", tw.func_rosenbrock_nd, np.zeros(64))]
+    # newtoncg uses finite difference hessian vector products, their gradients count as calls
+    methods = [("line search, bfgs", {"direction": "bfgs"}),
+               ("line search, newtoncg", {"direction": "newtoncg"}),
+               ("trust, dogleg bfgs", {"direction": "bfgs", "globalization": "trustregion"}),
+               ("trust, steihaug bfgs", {"direction": "bfgs", "globalization": "trustregion",
+                                         "tr_solver": "steihaug"}),
+               ("trust, steihaug newtoncg", {"direction": "newtoncg", "globalization": "trustregion"})]
+    print(f"{'method':26}" + "".join(f"{name:>16}" for name, _, _ in problems))
+    for label, options in methods:
+        row = f"{label:26}"
+        for _, func_in, x0 in problems:
+            iters, fcalls, converged = run(func_in, x0, options)
+            row += f"{f'{iters} / {fcalls}' + ('' if converged else ' x'):>16}"
+        print(row)
+    print("iterations / function calls, x: did not converge")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+from multiprocessing import Pool
+
+import numpy as np
+from scipy.stats import qmc
+
+from uncon_optimizer import uncon_optimizer
+
+
+def sample_starts(lb, ub, n, method="lhs", seed=None):
+    """
+    Space filling start points in the box [lb, ub], one per row.
+    method is "lhs" (latin hypercube, every variable gets one point in each of n strata),
+    "sobol" (scrambled sobol sequence, best with n a power of 2) or "random".
+    """
+    lb = np.asarray(lb, dtype=float)
+    ub = np.asarray(ub, dtype=float)
+    if method == "lhs":
+        unit = qmc.LatinHypercube(d=len(lb), seed=seed).random(n)
+    elif method == "sobol":
+        unit = qmc.Sobol(d=len(lb), seed=seed).random(n)
+    else:
+        unit = np.random.default_rng(seed).random((n, len(lb)))
+    return qmc.scale(unit, lb, ub)
+
+
+def _optimize(job):
+    # runs in a worker, func has to be picklable (defined at module level)
+    func, x0, epsilon_g, options = job
+    x, f, output = uncon_optimizer(func, x0, epsilon_g, dict(options))
+    return x0, x, f, output['iterations'], output['infnorm'][-1] <= epsilon_g
+
+
+def multistart(func, lb, ub, epsilon_g, n_starts=64, options=None):
+    """
+    Runs uncon_optimizer from many start points in [lb, ub] and collects the distinct minima
+    it finds. The runs are independent, so they go to a process pool. Converged results are
+    clustered: a result within tol_x of a known minimum (relative to its norm) is another hit
+    on that basin, anything else is a new minimum. Once patience converged runs in a row only
+    hit known basins the remaining starts are dropped.
+
+    options:
+    - sampling: "lhs", "sobol" or "random", see sample_starts.
+    - seed: for the sampling.
+    - processes: pool size, 1 runs in this process. Defaults to the cpu count.
+    - patience: converged runs in a row without a new minimum before stopping, None never stops.
+    - tol_x: distance at which two results are the same minimum.
+    - uncon: options for every uncon_optimizer run, a max_iter keeps bad starts from running away.
+
+    Returns the best x, its f and an output dict with
+    - minima: list of dicts with x, f and hits (runs that ended there), best first.
+    - starts: the start points that were run.
+    - iterations: total uncon_optimizer iterations.
+    - failed: runs that did not reach epsilon_g.
+    - stopped_early: whether patience dropped starts.
+    """
+    if options is None:
+        options = {}
+    if "sampling" not in options:
+        options["sampling"] = "lhs"
+    if "seed" not in options:
+        options["seed"] = None
+    if "processes" not in options:
+        options["processes"] = None
+    if "patience" not in options:
+        options["patience"] = 16
+    if "tol_x" not in options:
+        options["tol_x"] = 1e-4
+    if "uncon" not in options:
+        options["uncon"] = {}
+    # the runs only report their end point, no need to ship every iterate back
+    uncon_options = {"max_iter": 1000, "history": False, **options["uncon"]}
+
+    starts = sample_starts(lb, ub, n_starts, options["sampling"], options["seed"])
+    jobs = [(func, x0, epsilon_g, uncon_options) for x0 in starts]
+
+    minima = []
+    ran = []
+    iterations = 0
+    failed = 0
+    since_new = 0
+    stopped_early = False
+
+    def collect(results):
+        nonlocal iterations, failed, since_new, stopped_early
+        for x0, x, f, iters, converged in results:
+            ran.append(x0)
+            iterations += iters
+            if not converged:
+                failed += 1
+                continue
+            known = None
+            for minimum in minima:
+                if np.linalg.norm(x - minimum['x']) <= options["tol_x"]*(1 + np.linalg.norm(minimum['x'])):
+                    known = minimum
+                    break
+            if known is None:
+                minima.append({'x': x, 'f': f, 'hits': 1})
+                since_new = 0
+            else:
+                known['hits'] += 1
+                # keep the better representative of the basin
+                if f < known['f']:
+                    known['x'], known['f'] = x, f
+                since_new += 1
+            if options["patience"] is not None and since_new >= options["patience"]:
+                stopped_early = len(ran) < len(jobs)
+                return
+
+    if options["processes"] == 1:
+        collect(map(_optimize, jobs))
+    else:
+        # leaving the with block terminates the pool, dropping the starts not yet collected
+        with Pool(options["processes"]) as pool:
+            collect(pool.imap(_optimize, jobs))
+
+    minima.sort(key=lambda minimum: minimum['f'])
+    output = {
+        'minima': minima,
+        'starts': np.array(ran),
+        'iterations': iterations,
+        'failed': failed,
+        'stopped_early': stopped_early,
+    }
+    if not minima:
+        return None, None, output
+    return minima[0]['x'], minima[0]['f'], output
+
+
+# the quartic from problem 2.2, a global minimum, a local minimum and a saddle point
+def func_quartic(x):
+    f = x[0]**4 + 3*x[0]**3 + 3*x[1]**2 - 6*x[0]*x[1] - 2*x[1]
+    df = np.array([4*x[0]**3 + 9*x[0]**2 - 6*x[1], 6*x[1] - 6*x[0] - 2])
+    return f, df
+
+
+if __name__ == "__main__":
+    for sampling in ["lhs", "sobol"]:
+        xopt, fopt, output = multistart(func_quartic, [-5, -5], [3, 3], 1e-6, 64,
+                                        {"sampling": sampling, "seed": 0})
+        print(f"{sampling}: {len(output['starts'])} starts, stopped early: {output['stopped_early']}, "
+              f"failed: {output['failed']}, iterations: {output['iterations']}")
+        for minimum in output['minima']:
+            print(f"\tx: {minimum['x']}, f: {minimum['f']:.6f}, hits: {minimum['hits']}")
@@ -226,20 +226,18 @@ def func_rosenbrock_nd(x):
     g : ndarray
         objective gradient
     """
-    n = len(x)
-    f = 0
-    for i in range(n - 1):
-        f += 100*(x[i + 1] - x[i]**2)**2 + (1 - x[i])**2
-
-    g = np.zeros(n)
-    for i in range(n):
-        if i == 0:  # no n-1 term
-            g[i] = -400*x[i]*(x[i+1]-x[i]**2) + 2*(x[i]-1)
-        elif i == n-1:  # no n+1 term
-            g[i] = 200*(x[i]-x[i-1]**2)
-        else:
-            g[i] = -400*x[i]*(x[i+1]-x[i]**2) + 2 * \
-                (x[i]-1) + 200*(x[i]-x[i-1]**2)
+    x = np.asarray(x)
+    # float at least, a complex x stays complex for complex step hessian vector products
+    x = x.astype(np.result_type(x, float))
+    # x[i+1] - x[i]**2 and 1 - x[i] show up in both f and g
+    t = x[1:] - x[:-1]**2
+    u = 1 - x[:-1]
+    f = np.sum(100*t**2 + u**2, axis=0)
+
+    g = np.zeros_like(x)
+    # no n-1 term for the first and no n+1 term for the last
+    g[:-1] = -400*x[:-1]*t - 2*u
+    g[1:] += 200*t
 
     return f, g
 
@@ -361,5 +359,30 @@ class TestsYouMustPass(unittest.TestCase):
         print('-----------------------------------------------------------------------------\n')
 
 
+class TestHessvec(unittest.TestCase):
+    def test_newtoncg_cs(self):
+        """Newton-CG with complex step hessian vector products on the 16 dimensional Rosenbrock function"""
+        x0 = np.zeros(16)
+        xopt, fopt, output = uncon_optimizer(
+            func_rosenbrock_nd, x0, epsilon_g=1e-6,
+            options={"direction": "newtoncg", "hessvec": "cs", "history": False})
+        np.testing.assert_allclose(xopt, np.ones(16), rtol=0, atol=1e-3)
+        self.assertLessEqual(np.max(np.abs(func_rosenbrock_nd(xopt)[1])), 1e-6)
+
+        # a zero product would leave cg at steepest descent, the fd products take about as many steps
+        _, _, output_fd = uncon_optimizer(
+            func_rosenbrock_nd, x0, epsilon_g=1e-6,
+            options={"direction": "newtoncg", "hessvec": "fd", "history": False})
+        self.assertLessEqual(output['iterations'], output_fd['iterations'] + 5)
+
+    def test_cs_real_gradient(self):
+        """The complex step has to refuse a func that drops the imaginary part"""
+        def func_real(x):
+            return func_rosenbrock_nd(np.real(x))
+
+        with self.assertRaises(TypeError):
+            uncon_optimizer(func_real, np.zeros(4), epsilon_g=1e-6,
+                            options={"direction": "newtoncg", "hessvec": "cs"})
+
 # if __name__ == '__main__':
 #     unittest.main()
@@ -57,6 +57,10 @@ def uncon_optimizer(func, x0, epsilon_g, options=None):
         # op`tions["direction"] = "steepdesc"
         # op`tions["direction"] = "conjgrad"
         options["direction"] = "bfgs"
+        # options["direction"] = "newtoncg"
+    if "linsearch" not in options and options["direction"] == "newtoncg":
+        # newton steps are already scaled, backtracking from the full step is all they need
+        options["linsearch"] = "backtrack"
     if "linsearch" not in options:
         # options["linsearch"] = "backtrack"
         options["linsearch"] = "bracket"
@@ -70,6 +74,41 @@ def uncon_optimizer(func, x0, epsilon_g, options=None):
         options["suffcur"] = 0.5
     if "stepinc" not in options:
         options["stepinc"] = 2
+    if "max_iter" not in options:
+        options["max_iter"] = np.inf
+    if "hessvec" not in options:
+        # for newtoncg: a function hv(x, v) returning the hessian times v, "fd" for a forward
+        # difference of the gradient or "cs" for a complex step (func has to take complex x)
+        options["hessvec"] = "fd"
+    if "forcing_max" not in options:
+        # largest eisenstat-walker forcing term, also the first one
+        options["forcing_max"] = 0.5
+    if "cg_max_iter" not in options:
+        # None is one per variable, where cg would be exact
+        options["cg_max_iter"] = None
+    if "history" not in options:
+        # keep every guess and gradient norm, off for long runs that only need the result
+        options["history"] = True
+    if "callback" not in options:
+        # called with the gradient infinity norm after every iteration (every accepted step with a
+        # trust region), e.g. a lib/instrument.py ConvergenceRate
+        options["callback"] = None
+    if "globalization" not in options:
+        options["globalization"] = "linesearch"
+        # options["globalization"] = "trustregion"
+    if "tr_solver" not in options:
+        # "dogleg" needs the bfgs matrix, newtoncg always uses "steihaug"
+        options["tr_solver"] = "dogleg"
+    if "tr_radius" not in options:
+        options["tr_radius"] = 1
+    if "tr_radius_max" not in options:
+        options["tr_radius_max"] = 100
+    if "tr_accept" not in options:
+        # smallest actual over predicted reduction for a step to be taken
+        options["tr_accept"] = 0.1
+
+    if options["globalization"] == "trustregion":
+        return uncon_trust(func, x0, epsilon_g, options, output)
 
     # TODO: Your code goes here!
     it = 0
@@ -82,21 +121,36 @@ def uncon_optimizer(func, x0, epsilon_g, options=None):
     # for direction
     df_prev = df
     dir_prev = dir_steepdesc(df)
-    inv_hess = 1/np.linalg.norm(df) * np.identity(len(x0))
+    # only bfgs needs the dense inverse hessian, newtoncg is meant for sizes where it doesn't fit
+    inv_hess = 1/np.linalg.norm(df) * np.identity(len(x0)) if options["direction"] == "bfgs" else 0
+    if options["direction"] == "newtoncg":
+        hessvec = get_hessvec(func, options["hessvec"])
+        eta = options["forcing_max"]
+        cg_iters = 0
 
     # lists to keep track of function values
     infnorm = [df_infnorm]
     guesses = [guess]
-    while df_infnorm > epsilon_g:
+    if options["callback"] is not None:
+        options["callback"](df_infnorm)
+    while df_infnorm > epsilon_g and it < options["max_iter"]:
         # print(f"it: {it}, infnorm: {df_infnorm}")
         # print(
         #     f"it: {it}, step: {step}, dir: {dir_prev}, guess: {guess}, f: {f}, df: {df}")
-        dir, inv_hess = get_dir(
-            options["direction"], df, df_prev, it, dir_prev, guess, guess_prev, inv_hess)
+        if options["direction"] == "newtoncg":
+            dir, inner = dir_newtoncg(hessvec, guess, df, eta, options["cg_max_iter"] or len(x0))
+            cg_iters += inner
+        else:
+            dir, inv_hess = get_dir(
+                options["direction"], df, df_prev, it, dir_prev, guess, guess_prev, inv_hess)
 
         phi_0 = f
         dphi_0 = np.dot(df, dir)
-        step_init = step*(np.dot(df_prev, dir_prev))/(np.dot(df, dir))
+        if options["direction"] == "newtoncg":
+            # a newton direction is already scaled, try its full step first
+            step_init = 1
+        else:
+            step_init = step*(np.dot(df_prev, dir_prev))/(np.dot(df, dir))
         step, f, new_df = get_step(options["linsearch"], func, guess, dir, phi_0, dphi_0, step_init,
                                    options["suffdec"], options["bktrk"], options["suffcur"], options["stepinc"])
 
@@ -106,17 +160,180 @@ def uncon_optimizer(func, x0, epsilon_g, options=None):
         dir_prev = dir
         df = new_df
         df_infnorm = np.linalg.norm(df, np.inf)
-        infnorm.append(df_infnorm)
-        guesses.append(guess)
+        if options["direction"] == "newtoncg":
+            eta = forcing_term(df, df_prev, eta, options["forcing_max"])
+        if options["history"]:
+            infnorm.append(df_infnorm)
+            guesses.append(guess)
+        else:
+            infnorm[-1] = df_infnorm
+            guesses[-1] = guess
+        if options["callback"] is not None:
+            options["callback"](df_infnorm)
 
         it += 1
 
     output['infnorm'] = np.array(infnorm)
     output['guesses'] = np.array(guesses)
     output['iterations'] = it
+    if options["direction"] == "newtoncg":
+        # one hessian vector product each
+        output['cg_iterations'] = cg_iters
+    # instrumented functions (like lib/instrument.py FevWrapper) keep their own evaluation summary
+    if hasattr(func, 'summary'):
+        output['fev_summary'] = func.summary(it)
 
     return guess, f, output
 
+
+def uncon_trust(func, x0, epsilon_g, options, output):
+    # trust region version of the loop above, the same bfgs or newtoncg models but the step
+    # comes from minimizing the model inside a radius instead of a line search along a direction
+    it = 0
+    rejected = 0
+    guess = np.array(x0, dtype=float)
+    radius = options["tr_radius"]
+    newtoncg = options["direction"] == "newtoncg"
+
+    f, df = func(guess)
+    df = np.array(df)
+    df_infnorm = np.linalg.norm(df, np.inf)
+    if newtoncg:
+        hessvec_x = get_hessvec(func, options["hessvec"])
+        eta = options["forcing_max"]
+        cg_iters = 0
+    else:
+        # the bfgs hessian itself this time, dogleg needs both B g and B^-1 g
+        hess = np.linalg.norm(df) * np.identity(len(x0))
+
+    infnorm = [df_infnorm]
+    guesses = [guess]
+    if options["callback"] is not None:
+        options["callback"](df_infnorm)
+    while df_infnorm > epsilon_g and it < options["max_iter"]:
+        if newtoncg:
+            def hessvec(v): return hessvec_x(guess, v, df)
+        else:
+            def hessvec(v): return hess @ v
+        if options["tr_solver"] == "dogleg" and not newtoncg:
+            p, pred = tr_dogleg(df, hess, radius)
+        else:
+            p, pred, inner = tr_steihaug(hessvec, df, radius, eta if newtoncg else 0.1,
+                                         options["cg_max_iter"] or len(x0))
+            if newtoncg:
+                cg_iters += inner
+
+        f_new, df_new = func(guess + p)
+        df_new = np.array(df_new)
+        # how well the model predicted the reduction, pred is positive
+        rho = (f - f_new)/pred if pred > 0 else -1
+        p_norm = np.linalg.norm(p)
+        if rho < 0.25:
+            radius = 0.25*p_norm
+        elif rho > 0.75 and p_norm >= 0.99*radius:
+            radius = min(2*radius, options["tr_radius_max"])
+
+        if rho > options["tr_accept"]:
+            if not newtoncg:
+                hess = bfgs_hess_update(hess, p, df_new - df)
+            guess = guess + p
+            df_prev = df
+            f, df = f_new, df_new
+            df_infnorm = np.linalg.norm(df, np.inf)
+            if newtoncg:
+                eta = forcing_term(df, df_prev, eta, options["forcing_max"])
+            # a rejected step leaves guess and gradient as they were, repeating them would
+            # only stall a ConvergenceRate callback, so only accepted steps are recorded
+            if options["history"]:
+                infnorm.append(df_infnorm)
+                guesses.append(guess)
+            else:
+                infnorm[-1] = df_infnorm
+                guesses[-1] = guess
+            if options["callback"] is not None:
+                options["callback"](df_infnorm)
+        else:
+            rejected += 1
+
+        it += 1
+
+    output['infnorm'] = np.array(infnorm)
+    output['guesses'] = np.array(guesses)
+    output['iterations'] = it
+    # iterations whose step was not taken, each still cost one evaluation
+    output['rejected'] = rejected
+    output['radius'] = radius
+    if newtoncg:
+        output['cg_iterations'] = cg_iters
+    if hasattr(func, 'summary'):
+        output['fev_summary'] = func.summary(it)
+
+    return guess, f, output
+
+
+def bfgs_hess_update(hess, s, y):
+    # bfgs update of the hessian approximation, skipped when the curvature condition fails
+    # since a trust region step need not satisfy the wolfe conditions
+    sy = np.dot(s, y)
+    if sy <= 1e-10*np.linalg.norm(s)*np.linalg.norm(y):
+        return hess
+    hs = hess @ s
+    return hess - np.outer(hs, hs)/np.dot(s, hs) + np.outer(y, y)/sy
+
+
+def tr_dogleg(df, hess, radius):
+    # dogleg path from the cauchy point to the newton point, cut at the radius
+    # returns the step and the reduction the model predicts for it
+    p_newton = -np.linalg.solve(hess, df)
+    if np.linalg.norm(p_newton) <= radius:
+        p = p_newton
+    else:
+        g_hess_g = df @ hess @ df
+        p_cauchy = -(np.dot(df, df)/g_hess_g)*df
+        if np.linalg.norm(p_cauchy) >= radius:
+            p = -radius*normalized(df)
+        else:
+            p = p_cauchy + boundary_tau(p_cauchy, p_newton - p_cauchy, radius)*(p_newton - p_cauchy)
+    return p, -(np.dot(df, p) + 0.5*(p @ hess @ p))
+
+
+def tr_steihaug(hessvec, df, radius, eta, max_iter):
+    # steihaug cg, cg on the model until the residual is below eta |df|, the iterate leaves the
+    # radius or the model shows negative curvature, the last two end on the boundary
+    # returns the step, the predicted reduction and the hessian vector products used
+    z = np.zeros_like(df)
+    r = df.copy()
+    d = -r
+    rr = np.dot(r, r)
+    tol = eta*np.linalg.norm(df)
+    # model change g.z + z.B.z/2, kept up to date without extra products
+    model = 0
+    for j in range(max_iter):
+        Bd = hessvec(d)
+        curv = np.dot(d, Bd)
+        alpha = rr/curv if curv > 0 else np.inf
+        if curv <= 0 or np.linalg.norm(z + alpha*d) >= radius:
+            tau = boundary_tau(z, d, radius)
+            return z + tau*d, -(model + tau*np.dot(d, r) + 0.5*tau**2*curv), j + 1
+        model += alpha*np.dot(d, r) + 0.5*alpha**2*curv
+        z = z + alpha*d
+        r = r + alpha*Bd
+        rr_new = np.dot(r, r)
+        if np.sqrt(rr_new) <= tol:
+            return z, -model, j + 1
+        d = -r + (rr_new/rr)*d
+        rr = rr_new
+    return z, -model, max_iter
+
+
+def boundary_tau(z, d, radius):
+    # positive tau with |z + tau d| = radius, z inside the radius
+    a = np.dot(d, d)
+    b = 2*np.dot(z, d)
+    c = np.dot(z, z) - radius**2
+    return (-b + np.sqrt(b**2 - 4*a*c))/(2*a)
+
+
 # direction functions
 
 
@@ -161,6 +378,61 @@ def dir_bfgs(df, df_prev, it, dir_prev, x, x_prev, inv_hess_prev):
     return -np.matmul(inv_hess, df), inv_hess
 
 
+def get_hessvec(func, hessvec_option):
+    # returns hv(x, v, df), df being the gradient at x that the finite difference reuses
+    if callable(hessvec_option):
+        return lambda x, v, df: hessvec_option(x, v)
+    if hessvec_option == "cs":
+        h = 1e-30
+
+        def hessvec_cs(x, v, df):
+            dg = func(x + 1j*h*v)[1]
+            # a func that casts x to float drops the step and every product would be 0
+            if not np.iscomplexobj(dg):
+                raise TypeError('hessvec "cs" needs a func that keeps a complex x complex, its gradient came back real.')
+            return np.imag(dg)/h
+        return hessvec_cs
+
+    def hessvec_fd(x, v, df):
+        h = np.sqrt(np.finfo(float).eps)*(1 + np.linalg.norm(x))/np.linalg.norm(v)
+        return (np.array(func(x + h*v)[1]) - np.array(df))/h
+    return hessvec_fd
+
+
+def dir_newtoncg(hessvec, x, df, eta, max_iter):
+    # truncated newton, cg on H p = -df using only hessian vector products,
+    # stopped once the residual is below eta |df| or the hessian shows negative curvature
+    p = np.zeros_like(df)
+    r = -np.array(df)
+    d = r.copy()
+    rr = np.dot(r, r)
+    tol = eta*np.linalg.norm(df)
+    for j in range(max_iter):
+        Hd = hessvec(x, d, df)
+        curv = np.dot(d, Hd)
+        if curv <= 0:
+            # every cg iterate so far is a descent direction, fall back to steepest descent on the first
+            return (p if j > 0 else -np.array(df)), j + 1
+        alpha = rr/curv
+        p = p + alpha*d
+        r = r - alpha*Hd
+        rr_new = np.dot(r, r)
+        if np.sqrt(rr_new) <= tol:
+            return p, j + 1
+        d = r + (rr_new/rr)*d
+        rr = rr_new
+    return p, max_iter
+
+
+def forcing_term(df, df_prev, eta_prev, eta_max, gamma=0.9, alpha=2):
+    # eisenstat-walker choice 2, loose while the gradient is large and tightening as it
+    # drops superlinearly, with their safeguard against shrinking too fast
+    eta = gamma*(np.linalg.norm(df)/np.linalg.norm(df_prev))**alpha
+    if gamma*eta_prev**alpha > 0.1:
+        eta = max(eta, gamma*eta_prev**alpha)
+    return min(eta, eta_max)
+
+
 # line search functions
 
 def get_step(lin_option, func, x, dir, phi_0, dphi_0, step_init, suffdec, bktrk, suffcur, stepinc):
@@ -1,5 +1,12 @@
+import os
+import sys
+
 import numpy as np
 
+# FevWrapper is shared with the other assignments
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lib"))
+from instrument import FevWrapper  # noqa: E402,F401
+
 # f_* are functions
 # h_* are equality constraints
 # g_* are inequality constraints
@@ -2,6 +2,7 @@
 
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse as sp
 from scipy.optimize import check_grad, minimize
 
 from uncon_optimizer import uncon_optimizer
@@ -38,27 +39,42 @@ def plot_constrained_opt(fx, constr1, opt, title):
 # uh = equality penalty parameter
 # ug = inequality penalty parameter
 
-def pen_ext_quad(x, ug, f, df, g, dg):
-    fx = f(x)
-    gx = g(x)
-    gx = np.where(gx > 0, gx, 0)
-    gx_pen = ug/2 * np.sum(gx**2)
+def pen_ext_quad(x, uh, ug, problem):
+    fx, dfx = problem.f(x), problem.df(x)
+    hx, dhx, gx, dgx = problem.constraints(x)
+    gx = np.maximum(gx, 0)
+    # hx @ dhx adds up each constraint's gradient scaled by its value
+    fx = fx + uh/2 * np.sum(hx**2) + ug/2 * np.sum(gx**2)
+    dfx = dfx + uh * (hx @ dhx) + ug * (gx @ dgx)
+    return fx, dfx
 
-    dfx = df(x)
-    # :, None to broadcast so that we can multiply element wise
-    # axis=0 so all the x1s and x2s are added together
-    dgx_pen = ug * np.sum(gx[:, None] * dg(x), axis=0)
 
-    return fx+gx_pen, dfx+dgx_pen
+def pen_int(x, uh, ug, problem):
+    fx, dfx = problem.f(x), problem.df(x)
+    hx, dhx, gx, dgx = problem.constraints(x)
+    # a barrier cant keep h = 0, so equalities get a quadratic penalty that grows as uh shrinks
+    fx = fx + np.sum(hx**2)/(2*uh) - ug * np.sum(np.log(-gx))
+    dfx = dfx + (hx @ dhx)/uh - ug * ((1/gx) @ dgx)
+    return fx, dfx
 
 
-def pen_int(x, ug, f, df, g, dg):
-    fx = f(x)
-    gx = g(x)
-    gx_pen = ug * np.sum(np.log(-gx))
-    dfx = df(x)
-    dgx_pen = ug * np.sum(dg(x)/gx[:, None], axis=0)
-    return fx-gx_pen, dfx-dgx_pen
+def aug_lagr(x, uh, ug, lambdas_h, lambdas_g, problem):
+    fx, dfx = problem.f(x), problem.df(x)
+    hx, dhx, gx, dgx = problem.constraints(x)
+    fx = fx + np.dot(lambdas_h, hx) + uh/2 * np.sum(hx**2)
+    dfx = dfx + (lambdas_h + uh*hx) @ dhx
+    # inequalities are shifted by their multipliers, so inactive ones drop out
+    # and active ones are held at g = 0 without ug going to infinity
+    gx_shift = np.maximum(gx + lambdas_g/ug, 0)
+    fx = fx + ug/2 * np.sum(gx_shift**2) - np.sum(lambdas_g**2)/(2*ug)
+    dfx = dfx + ug * (gx_shift @ dgx)
+    return fx, dfx
+
+
+def aug_lagr_constr_dist(x, ug, lambdas_g, problem):
+    # h must be 0, g must be <= 0 and for g < 0 its multiplier must be 0
+    hx, _, gx, _ = problem.constraints(x)
+    return np.sum(np.abs(hx)) + np.sum(np.abs(np.maximum(gx, -lambdas_g/ug)))
 
 
 h = .25
@@ -105,21 +121,107 @@ def constraint_can(x):
 #     return
 
 
+def as_jacobian(jac):
+    # scipy.sparse jacobians stay sparse, everything else becomes a 2d array
+    return sp.csr_array(jac) if sp.issparse(jac) else np.atleast_2d(jac)
+
+
+def vstack_jacobians(jacs):
+    if any(sp.issparse(jac) for jac in jacs):
+        return sp.vstack(jacs, format='csr')
+    return np.vstack(jacs)
+
+
+def dense(jac):
+    # for the few rows that end up in a dense factorization
+    return jac.toarray() if sp.issparse(jac) else jac
+
+
+def scale_rows(d, jac):
+    return sp.diags(d)@jac if sp.issparse(jac) else d[:, None]*jac
+
+
+def stack_constraints(funcs, jacs):
+    """
+    Combines a list of constraint functions and their jacobians into one function returning
+    all the values as a vector and one returning all the gradients as rows of a jacobian.
+    Each function can return a scalar or a vector, each jacobian a gradient or a matrix.
+    """
+    def c(x):
+        return np.concatenate([np.atleast_1d(func(x)) for func in funcs])
+
+    def dc(x):
+        return vstack_jacobians([as_jacobian(jac(x)) for jac in jacs])
+    return c, dc
+
+
 class ConstrainedProblem:
-    def __init__(self, f, df, h=None, dh=None, g=None, dg=None) -> None:
+    """
+    h(x) = 0 and g(x) <= 0, each given as one function or a list of functions,
+    with optional bounds lb <= x <= ub, use +-np.inf to leave a variable unbounded.
+    Jacobians can be dense arrays or scipy.sparse matrices, sparse ones are kept sparse.
+    """
+
+    def __init__(self, f, df, h=None, dh=None, g=None, dg=None, lb=None, ub=None) -> None:
         self.f = f
         self.df = df
+        if isinstance(h, (list, tuple)):
+            h, dh = stack_constraints(h, dh)
+        if isinstance(g, (list, tuple)):
+            g, dg = stack_constraints(g, dg)
         self.h = h
         self.dh = dh
         self.g = g
         self.dg = dg
-
-
-def penalized(pen_type, x, ug, problem: ConstrainedProblem):
+        self.lb = None if lb is None else np.asarray(lb, dtype=float)
+        self.ub = None if ub is None else np.asarray(ub, dtype=float)
+
+    def bounds(self, x):
+        # bounds as extra inequalities lb - x <= 0 and x - ub <= 0, only the finite ones
+        # their jacobian rows are sparse, one nonzero each
+        n = len(x)
+        eye = sp.identity(n, format='csr')
+        gx = [np.empty(0)]
+        dgx = [sp.csr_array((0, n))]
+        if self.lb is not None:
+            fin = np.flatnonzero(np.isfinite(self.lb))
+            gx.append(self.lb[fin] - x[fin])
+            dgx.append(-eye[fin])
+        if self.ub is not None:
+            fin = np.flatnonzero(np.isfinite(self.ub))
+            gx.append(x[fin] - self.ub[fin])
+            dgx.append(eye[fin])
+        return np.concatenate(gx), sp.vstack(dgx, format='csr')
+
+    def constraints(self, x):
+        """
+        Evaluates every constraint once, returns h, dh, g, dg with the bounds appended to g.
+        Missing constraints come back as empty arrays so the penalties dont need special cases.
+        """
+        x = np.asarray(x, dtype=float)
+        n = len(x)
+        if self.h is not None:
+            hx, dhx = np.atleast_1d(self.h(x)), as_jacobian(self.dh(x))
+        else:
+            hx, dhx = np.empty(0), np.empty((0, n))
+        if self.g is not None:
+            gx, dgx = np.atleast_1d(self.g(x)), as_jacobian(self.dg(x))
+        else:
+            gx, dgx = np.empty(0), np.empty((0, n))
+        bx, dbx = self.bounds(x)
+        if not (sp.issparse(dhx) or sp.issparse(dgx)) and len(hx) + len(gx) > 0:
+            # a dense problem, its few bound rows are cheaper dense than turning it all sparse
+            dbx = dbx.toarray()
+        return hx, dhx, np.concatenate([gx, bx]), vstack_jacobians([dgx, dbx])
+
+
+def penalized(pen_type, x, ug, problem: ConstrainedProblem, uh=None, lambdas_h=None, lambdas_g=None):
     if pen_type == 'int':
-        return lambda x: pen_int(x, ug, problem.f, problem.df, problem.g, problem.dg)
+        return lambda x: pen_int(x, uh, ug, problem)
     elif pen_type == 'ext':
-        return lambda x: pen_ext_quad(x, ug, problem.f, problem.df, problem.g, problem.dg)
+        return lambda x: pen_ext_quad(x, uh, ug, problem)
+    elif pen_type == 'alm':
+        return lambda x: aug_lagr(x, uh, ug, lambdas_h, lambdas_g, problem)
 
 
 def con_optimizer(problem: ConstrainedProblem, x0, epsilon_g, options=None, opt_options=None):
@@ -134,6 +236,26 @@ def con_optimizer(problem: ConstrainedProblem, x0, epsilon_g, options=None, opt_
         options["p"] = 2
     if "pen" not in options:
         options["pen"] = "ext"
+    if "warm_start" not in options:
+        # the barrier hessian changes too much between interior penalty subproblems for the
+        # carried bfgs model to help, it costs iterations there (103 warm vs 91 cold on 5.4)
+        options["warm_start"] = options["pen"] != "int"
+    if "output" not in options:
+        # also return the output dict, by default only the guess is returned like before
+        options["output"] = False
+    if "max_iter" not in options:
+        options["max_iter"] = 100
+    if "alm_decrease" not in options:
+        # alm only raises the penalties when the constraint distance shrinks slower than this
+        options["alm_decrease"] = 0.25
+    if "inner_tol" not in options:
+        # loosest tolerance for the subproblems, set to epsilon_g to solve every one exactly
+        options["inner_tol"] = 1e-3
+    if "inner_tol_factor" not in options:
+        # the subproblem tolerance follows the constraint distance times this factor
+        options["inner_tol_factor"] = 1
+    if "inner_max_iter" not in options:
+        options["inner_max_iter"] = 50
 
     it = 0
     guess = x0
@@ -149,26 +271,244 @@ def con_optimizer(problem: ConstrainedProblem, x0, epsilon_g, options=None, opt_
         opt_options = {
             'step_init': 0.5,
         }
-    constraints = problem.g
-    constr_dist = np.sum(np.abs(constraints(guess)))
+    alm = options['pen'] == 'alm'
+    if alm:
+        hx, _, gx, _ = problem.constraints(guess)
+        lambdas_h = np.zeros(len(hx))
+        lambdas_g = np.zeros(len(gx))
+
+        def constr_distance(x):
+            return aug_lagr_constr_dist(x, ug, lambdas_g, problem)
+    else:
+        lambdas_h = lambdas_g = None
+
+        def constr_distance(x):
+            hx, _, gx, _ = problem.constraints(x)
+            if options['pen'] == 'int':
+                # g < 0 at every barrier iterate, what is left is the barrier gap of ug per inequality
+                return np.sum(np.abs(hx)) + ug*len(gx)
+            # inequalities and bounds only count when violated, inactive ones are at their optimum
+            return np.sum(np.abs(hx)) + np.sum(np.maximum(gx, 0))
+    constr_dist = constr_distance(guess)
     constr_dists = [constr_dist]
-
-    while constr_dist > epsilon_g:
-        func_pen = penalized(options['pen'], guess, ug, problem)
+    inner_iters = []
+    inner_tols = []
+    fev = 0
+    # quasi-newton state carried from one subproblem to the next
+    warm = {}
+    # only stop once a subproblem has been solved to epsilon_g
+    tight = False
+
+    while (constr_dist > epsilon_g or not tight) and it < options['max_iter']:
+        func_pen = fn.FevWrapper(penalized(options['pen'], guess, ug,
+                                           problem, uh, lambdas_h, lambdas_g))
+        # loose while far from feasible, tightening to epsilon_g as the constraint distance shrinks
+        inner_tol = max(epsilon_g, min(options["inner_tol"],
+                                       options["inner_tol_factor"]*constr_dist))
+        inner_tols.append(inner_tol)
         # print(
         #     f"Constrained Optimizer loop {it} with u:{ug}, guess: {guess}, f: {func_pen(guess)}, constraint dist: {constr_dist}")
+        # copy so the defaults uncon_optimizer fills in and the warm start dont leak into the callers options
+        sub_options = dict(opt_options, **warm)
+        sub_options.setdefault("max_iter", options["inner_max_iter"])
         guess, f, output = uncon_optimizer(
-            func_pen, guess_prev, epsilon_g, opt_options)
+            func_pen, guess_prev, inner_tol, sub_options)
+        tight = inner_tol <= epsilon_g and output['infnorm'][-1] <= epsilon_g
+        fev += func_pen.get_fev()
+        if options['warm_start'] and output['iterations'] > 0:
+            warm = {'inv_hess': output['inv_hess'], 'step': output['step']}
+        inner_iters.append(output['iterations'])
         guesses.append(guess)
-        constr_dist = np.sum(np.abs(constraints(guess)))
+        if alm:
+            # first order multiplier updates
+            hx, _, gx, _ = problem.constraints(guess)
+            lambdas_h = lambdas_h + uh*hx
+            lambdas_g = np.maximum(lambdas_g + ug*gx, 0)
+        constr_dist_prev = constr_dist
+        constr_dist = constr_distance(guess)
         constr_dists.append(constr_dist)
-        uh = options["p"]*uh
-        ug = options["p"]*ug
+        if not alm or constr_dist > options["alm_decrease"]*constr_dist_prev:
+            uh = options["p"]*uh
+            ug = options["p"]*ug
         guess_prev = guess
         it += 1
+
+    output = {
+        'iterations': it,
+        'inner_iterations': np.array(inner_iters),
+        'total_inner_iterations': np.sum(inner_iters, dtype=int),
+        'inner_tols': np.array(inner_tols),
+        'fev': fev,
+        'guesses': np.array(guesses),
+        'constr_dists': np.array(constr_dists),
+        'success': constr_dist <= epsilon_g and tight,
+        'lambdas_h': lambdas_h,
+        'lambdas_g': lambdas_g,
+    }
+    if options["output"]:
+        return guess, output
     return guess
 
 
+def fraction_to_boundary(v, dv, tau):
+    # largest step in (0, 1] that keeps v + step*dv >= (1-tau)*v for v > 0
+    shrinking = dv < 0
+    if not np.any(shrinking):
+        return 1
+    return min(1, np.min(-tau*v[shrinking]/dv[shrinking]))
+
+
+def ip_optimizer(problem: ConstrainedProblem, x0, epsilon_g, options=None):
+    """
+    Primal-dual interior point method, the inequalities get slacks g(x) + s = 0 with s >= 0 and
+    newton steps on the perturbed KKT conditions use a damped BFGS hessian of the lagrangian.
+    The barrier parameter follows mehrotra's predictor-corrector instead of a fixed shrink factor.
+    """
+    if options is None:
+        options = {}
+    if "max_iter" not in options:
+        options["max_iter"] = 100
+    if "tau_min" not in options:
+        # fraction to boundary, how close a step can take the slacks and multipliers to 0
+        options["tau_min"] = 0.99
+    if "s_min" not in options:
+        options["s_min"] = 1
+
+    x = np.asarray(x0, dtype=float)
+    nx = len(x)
+    f, df = problem.f(x), problem.df(x)
+    h, dh, g, dg = problem.constraints(x)
+    nh = len(h)
+    ng = len(g)
+    s = np.maximum(-g, options["s_min"])
+    z = np.ones(ng)
+    lambdas_h = np.zeros(nh)
+    hess = np.identity(nx)
+    nu = 1
+    kkt = np.zeros((nx+nh, nx+nh))
+    rhs = np.zeros(nx+nh)
+
+    def residuals(df, dh, dg, h, g, s, z, lambdas_h):
+        return df + dh.T@lambdas_h + dg.T@z, h, g + s
+
+    def newton_step(r_d, r_h, r_g, r_c):
+        # slacks and inequality multipliers are eliminated, leaving
+        # hess + dg.T Z/S dg  dh.T | dx       | -r_d - dg.T S^-1 (Z r_g - r_c)
+        # dh                  0    | dlambdas | -r_h
+        kkt[:nx, :nx] = hess + dense(dg.T@scale_rows(z/s, dg))
+        kkt[nx:, :nx] = dense(dh)
+        kkt[:nx, nx:] = dense(dh).T
+        rhs[:nx] = -r_d - dg.T@((z*r_g - r_c)/s)
+        rhs[nx:] = -r_h
+        sol = np.linalg.solve(kkt, rhs)
+        dx = sol[:nx]
+        ds = -r_g - dg@dx
+        dz = (-r_c - z*ds)/s
+        return dx, ds, dz, sol[nx:]
+
+    def converged():
+        return max(np.linalg.norm(r_d, np.inf), np.linalg.norm(r_h, np.inf),
+                   np.linalg.norm(r_g, np.inf), mu) <= epsilon_g
+
+    r_d, r_h, r_g = residuals(df, dh, dg, h, g, s, z, lambdas_h)
+    mu = np.dot(s, z)/ng if ng > 0 else 0
+    it = 0
+    guesses = [x]
+    mus = [mu]
+
+    while not converged() and it < options["max_iter"]:
+        tau = min(max(options["tau_min"], 1 - mu), 1 - 1e-8)
+        # predictor, pure newton step towards mu = 0
+        dx, ds, dz, dl = newton_step(r_d, r_h, r_g, s*z)
+        sigma = 0
+        if ng > 0:
+            step_p = fraction_to_boundary(s, ds, 1)
+            step_d = fraction_to_boundary(z, dz, 1)
+            mu_aff = np.dot(s + step_p*ds, z + step_d*dz)/ng
+            # mehrotra's centering, but no lower than needed for the tolerance
+            # or the slacks collapse onto the bounds before the gradient has converged
+            sigma = min(1, max((mu_aff/mu)**3, 0.1*epsilon_g/mu))
+            # corrector, aims at sigma*mu and accounts for the second order complementarity term
+            dx, ds, dz, dl = newton_step(r_d, r_h, r_g, s*z + ds*dz - sigma*mu)
+        step_p = fraction_to_boundary(s, ds, tau)
+        step_d = fraction_to_boundary(z, dz, tau)
+
+        # backtrack the primal step on the barrier merit function with an l1 penalty on the
+        # infeasibility, the penalty has to outweigh the multipliers for the step to be descent
+        mu_target = sigma*mu if ng > 0 else 0
+        nu = max(nu, 1.05*np.max(np.abs(np.concatenate([lambdas_h + dl, z + dz])), initial=0))
+        infeas_0 = np.sum(np.abs(r_h)) + np.sum(np.abs(r_g))
+        phi_0 = f - mu_target*np.sum(np.log(s)) + nu*infeas_0
+        dphi_0 = df@dx - mu_target*np.sum(ds/s) - nu*infeas_0
+        while True:
+            x_new = x + step_p*dx
+            s_new = s + step_p*ds
+            f_new = problem.f(x_new)
+            h_new, dh_new, g_new, dg_new = problem.constraints(x_new)
+            phi = f_new - mu_target*np.sum(np.log(s_new)) + \
+                nu*(np.sum(np.abs(h_new)) + np.sum(np.abs(g_new + s_new)))
+            # close to the solution the primal-dual step need not be a descent direction for the
+            # primal merit function, it is a newton step on the KKT conditions so take it
+            if dphi_0 >= 0 or phi <= phi_0 + 1e-4*step_p*dphi_0 or step_p < 1e-10:
+                break
+            step_p *= 0.5
+        df_new = problem.df(x_new)
+
+        # damped BFGS update of the hessian of the lagrangian, same as in the sqp
+        lambdas_h = lambdas_h + step_d*dl
+        z = z + step_d*dz
+        s_k = x_new - x
+        y_k = (df_new + dh_new.T@lambdas_h + dg_new.T@z) - (df + dh.T@lambdas_h + dg.T@z)
+        sty = s_k@y_k
+        sHs = s_k@hess@s_k
+        if sHs > 0:
+            theta = 1 if sty >= 0.2*sHs else 0.8*sHs/(sHs - sty)
+            r_k = theta*y_k + (1-theta)*hess@s_k
+            hess = hess - np.outer(hess@s_k, hess@s_k)/sHs + np.outer(r_k, r_k)/(r_k@s_k)
+
+        x = x_new
+        s = s_new
+        f, df, h, dh, g, dg = f_new, df_new, h_new, dh_new, g_new, dg_new
+        r_d, r_h, r_g = residuals(df, dh, dg, h, g, s, z, lambdas_h)
+        mu = np.dot(s, z)/ng if ng > 0 else 0
+        guesses.append(x)
+        mus.append(mu)
+        it += 1
+
+    output = {
+        'iterations': it,
+        'guesses': np.array(guesses),
+        'mus': np.array(mus),
+        'success': converged(),
+        'lambdas_h': lambdas_h,
+        'lambdas_g': z,
+        'slacks': s,
+    }
+    return x, output
+
+
+def print_con_result(name, xopt, output):
+    print(f"{name}: {xopt}, converged: {output['success']}, outer iterations: {output['iterations']}, "
+          f"inner iterations: {output['total_inner_iterations']}")
+
+
+def compare_warm_start(name, problem, x0, epsilon_g, options, opt_options):
+    xopt, output = con_optimizer(problem, x0, epsilon_g,
+                                 dict(options, warm_start=True, output=True), opt_options)
+    _, output_cold = con_optimizer(problem, x0, epsilon_g,
+                                   dict(options, warm_start=False, output=True), opt_options)
+    print(f"{name}: {xopt}, outer iterations: {output['iterations']}, "
+          f"inner iterations: {output['total_inner_iterations']} warm start / {output_cold['total_inner_iterations']} cold start")
+
+
+def compare_inner_tol(name, problem, x0, epsilon_g, options, opt_options):
+    xopt, output = con_optimizer(problem, x0, epsilon_g, dict(options, output=True), opt_options)
+    xopt_exact, output_exact = con_optimizer(problem, x0, epsilon_g,
+                                             dict(options, inner_tol=epsilon_g, output=True), opt_options)
+    print(f"{name}: {xopt} adaptive / {xopt_exact} exact, "
+          f"function evaluations: {output['fev']} adaptive / {output_exact['fev']} exact")
+
+
 if __name__ == "__main__":
     print("- Exaple 5.4:")
     x0 = np.array([-2, -1])
@@ -189,8 +529,18 @@ if __name__ == "__main__":
         'constraint': fn.e5_4_g
     }
 
-    print(
-        f"Exterior penalty: {(con_optimizer(e5_4, x0, epsilon_g, options, opt_options))}")
+    compare_warm_start("Exterior penalty", e5_4, x0,
+                       epsilon_g, options, opt_options)
+    compare_inner_tol("Exterior penalty", e5_4, x0,
+                      epsilon_g, options, opt_options)
+    print_con_result("Augmented Lagrangian", *con_optimizer(
+        e5_4, x0, epsilon_g, dict(options, pen='alm', output=True), opt_options))
+    # an inactive inequality has nothing to close and must not keep the penalty from stopping
+    e5_4_inactive = ConstrainedProblem(fn.e5_4_f, fn.e5_4_df,
+                                       g=[fn.e5_4_g, lambda x: x[0] - 10],
+                                       dg=[fn.e5_4_dg, lambda x: np.array([1., 0])])
+    print_con_result("Exterior penalty, inactive x0 <= 10", *con_optimizer(
+        e5_4_inactive, x0, epsilon_g, dict(options, output=True), opt_options))
 
     x0 = np.array([-1, 0])
     # x0 = np.array([0, 0.5])
@@ -208,29 +558,54 @@ if __name__ == "__main__":
         'linsearch': 'backtrack',
         'constraint': fn.e5_4_g
     }
-    print(
-        f"Interior penalty: {con_optimizer(e5_4, x0, epsilon_g, options, opt_options)}")
+    # shown for comparison, warm starting costs iterations here so it is off by default
+    compare_warm_start("Interior penalty", e5_4, x0,
+                       epsilon_g, options, opt_options)
+    compare_inner_tol("Interior penalty", e5_4, x0,
+                      epsilon_g, options, opt_options)
+    xopt, output = ip_optimizer(e5_4, x0, epsilon_g)
+    print(f"Interior point: {xopt}, converged: {output['success']}, iterations: {output['iterations']}")
 
     # plot_constrained_opt(func, constraint_5_4, x0,
     #                      "Contour plot of the cross-sectional area with stress constraints")
 
     print("- Cantelever problem from 4.2")
-    p4_2 = ConstrainedProblem(fn.p42_f, fn.p42_df, g=fn.p42_g, dg=fn.p42_dg)
+    # without the bounds the penalized problem runs off to negative thicknesses
+    p4_2 = ConstrainedProblem(fn.p42_f, fn.p42_df, g=fn.p42_g, dg=fn.p42_dg,
+                              lb=[0.005, 0.002])
     x0 = np.array([0.013, 0.004])
     epsilon_g = 1e-5
     options = {
         'pen': 'ext',
         'uh': 1,
-        'ug': 0.5,
-        'p': 1.1,
+        'ug': 100,
+        'p': 2,
     }
     opt_options = {
         'step_init': 1,
         'constraint': fn.p42_g
     }
 
-    print(
-        f"Exterior penalty cantilever: {(con_optimizer(p4_2, x0, epsilon_g, options, opt_options))}")
+    compare_warm_start("Exterior penalty cantilever", p4_2, x0,
+                       epsilon_g, options, opt_options)
+    print_con_result("Augmented Lagrangian cantilever", *con_optimizer(
+        p4_2, x0, epsilon_g, dict(options, pen='alm', output=True), opt_options))
+    xopt, output = ip_optimizer(p4_2, x0, epsilon_g)
+    print(f"Interior point cantilever: {xopt}, converged: {output['success']}, iterations: {output['iterations']}")
+
+    print("- Many local constraints with a sparse jacobian")
+    # pairs of neighbouring variables limited like the per element stresses of a truss
+    n = 200
+    target = np.linspace(-1, 2, n)
+    A = sp.diags([np.ones(n-1), np.ones(n-1)], [0, 1], shape=(n-1, n), format='csr')
+    local = ConstrainedProblem(lambda x: np.sum((x - target)**2), lambda x: 2*(x - target),
+                               g=lambda x: A@x - 1.5, dg=lambda x: A, lb=-5*np.ones(n))
+    xopt, output = ip_optimizer(local, np.zeros(n), 1e-6)
+    print(f"Interior point: f: {local.f(xopt)}, converged: {output['success']}, iterations: {output['iterations']}")
+    xopt, output = con_optimizer(local, np.zeros(n), 1e-6, {'pen': 'alm', 'ug': 10, 'p': 2, 'output': True},
+                                  {'step_init': 1})
+    print(f"Augmented Lagrangian: f: {local.f(xopt)}, converged: {output['success']}, "
+          f"outer iterations: {output['iterations']}, inner iterations: {output['total_inner_iterations']}")
 
     # print(check_grad(func, grad, [0, 0]))
     # print(check_grad(func, grad, [-0.5, 0.5]))
@@ -1,5 +1,11 @@
 import numpy as np
 import matplotlib.pyplot as plt
+import scipy.sparse as sp
+from scipy.linalg import cho_solve, solve_triangular
+from scipy.sparse.linalg import lsqr, spsolve
+
+from prob4_3 import ConstrainedProblem, dense, vstack_jacobians
+import functions as fn
 
 
 def plot_constrained_opt(fx, constr1, guesses, title):
@@ -40,127 +46,379 @@ def ph_5_4(x):
     return h1
 
 
-def f_5_4(x):
-    return float(x[0] + 2*x[1]), np.array([1, 2])
+def chol_update(L, x, sign=1):
+    """
+    Rank one update (sign=1) or downdate (sign=-1) of the lower cholesky factor L in place,
+    so that L L.T becomes L L.T + sign*x x.T in O(n^2). Returns False if a downdate loses
+    positive definiteness, L is garbage in that case.
+    """
+    x = np.array(x, dtype=float)
+    n = len(x)
+    for k in range(n):
+        r2 = L[k, k]**2 + sign*x[k]**2
+        if r2 <= 0:
+            return False
+        r = np.sqrt(r2)
+        c = r/L[k, k]
+        s = x[k]/L[k, k]
+        L[k, k] = r
+        L[k+1:, k] = (L[k+1:, k] + sign*s*x[k+1:])/c
+        x[k+1:] = c*x[k+1:] - s*L[k+1:, k]
+    return True
 
-# equality constraints
 
+class KKTSolver:
+    """
+    Solves the equality constrained QP
+    hess A.T | p_x      | -grad
+    A    0   | p_lambda | -c
+    for the damped BFGS hessian of the lagrangian, keeping its cholesky factor up to date
+    with rank one updates instead of refactorizing. A can be a scipy.sparse matrix, the range
+    space method only densifies hess^-1 A.T (which is dense anyway), the dense method solves
+    a sparse kkt matrix and the null space method needs the dense QR of A.T.
 
-def h_5_4(x):
-    h1 = 1/4*x[0]**2 + x[1]**2 - 1
-    dx_h1 = np.array([1/2*x[0], 2*x[1]])
-
-    return np.array([h1]), np.array([dx_h1])
-
-
-def QNSQP(x0, tol_opt, tol_feas, func, func_h, uh):
-    a_init = 1
-    f, dx_f = func(x0)
-    dx_f_prev = dx_f
-    h, dx_h = func_h(x0)
-    nx = len(x0)
-    # nh = len
-    lambdas = np.zeros(h.shape)
-    dx_lagr = dx_f + dx_h.T@lambdas
-    x_k = x0
-    x_k_prev = x_k
+    Parameters:
+    - nx (int): number of variables.
+    - n_con (int): most constraints that can be active, sizes the dense storage for dense A.
+    - method (str): 'range' eliminates p_x using the cholesky factor, 'null' solves in the null
+      space of A from its QR, 'dense' solves the whole matrix, 'auto' picks range space for
+      few active constraints and null space once they take up most of the variables.
+    """
+
+    def __init__(self, nx, n_con, method='auto'):
+        self.nx = nx
+        self.method = method
+        self.hess = np.identity(nx)
+        self.chol = np.identity(nx)
+        self.n_con = n_con
+        # dense kkt storage, only allocated once a dense A needs it
+        self.kkt = None
+        self.rhs = np.zeros(nx+n_con)
+        self.refactors = 0
+
+    def bfgs_update(self, s_k, r_k):
+        hs = self.hess@s_k
+        u = hs/np.sqrt(s_k.T@hs)
+        v = r_k/np.sqrt(r_k.T@s_k)
+        self.hess = self.hess - np.outer(u, u) + np.outer(v, v)
+        # update before the downdate so the factor stays positive definite in between
+        if not (chol_update(self.chol, v, 1) and chol_update(self.chol, u, -1)):
+            self.chol = np.linalg.cholesky(self.hess)
+            self.refactors += 1
+
+    def solve(self, grad, A, c):
+        nx = self.nx
+        na = len(c)
+        method = self.method
+        if method == 'auto':
+            method = 'null' if 2*na > nx else 'range'
+        if na == 0:
+            p_x = cho_solve((self.chol, True), -grad)
+            return p_x, np.empty(0)
+        if method == 'range':
+            # p_x = -hess^-1 (grad + A.T lambda), then A p_x = -c gives the schur complement
+            hinv_grad = cho_solve((self.chol, True), grad)
+            hinv_At = cho_solve((self.chol, True), dense(A.T))
+            lambdas = np.linalg.solve(A@hinv_At, c - A@hinv_grad)
+            p_x = -hinv_grad - hinv_At@lambdas
+        elif method == 'null':
+            # A.T = Y R, the step is a particular solution in Y plus whatever minimizes in Z
+            Q, R = np.linalg.qr(dense(A.T), mode='complete')
+            Y = Q[:, :na]
+            Z = Q[:, na:]
+            R = R[:na]
+            p_y = solve_triangular(R.T, -c, lower=True)
+            grad_y = grad + self.hess@(Y@p_y)
+            if na < nx:
+                p_z = np.linalg.solve(Z.T@self.hess@Z, -Z.T@grad_y)
+                p_x = Y@p_y + Z@p_z
+            else:
+                p_x = Y@p_y
+            lambdas = solve_triangular(R, -Y.T@(grad + self.hess@p_x))
+        elif sp.issparse(A):
+            kkt = sp.bmat([[sp.csr_array(self.hess), A.T], [A, None]], format='csc')
+            sol = spsolve(kkt, np.concatenate([-grad, -c]))
+            p_x = sol[:nx]
+            lambdas = sol[nx:]
+        else:
+            if self.kkt is None:
+                self.kkt = np.zeros((nx+self.n_con, nx+self.n_con))
+            kkt = self.kkt
+            kkt[:nx, :nx] = self.hess
+            kkt[nx:nx+na, :nx] = A
+            kkt[:nx, nx:nx+na] = A.T
+            kkt[nx:nx+na, nx:nx+na] = 0
+            self.rhs[:nx] = -grad
+            self.rhs[nx:nx+na] = -c
+            sol = np.linalg.solve(kkt[:nx+na, :nx+na], self.rhs[:nx+na])
+            p_x = sol[:nx]
+            lambdas = sol[nx:]
+        return p_x, lambdas
+
+
+def active_set_qp(solver, grad, dhx, hx, dgx, gx, working, max_iter):
+    """
+    Solves min 1/2 p.T hess p + grad.T p  s.t.  dhx p + hx = 0, dgx p + gx <= 0
+    treating the inequalities in the working set as equalities, dropping the one with the most
+    negative multiplier or adding the most violated one until neither happens.
+    The active rows are stacked with vstack_jacobians, so sparse jacobians stay sparse.
+    Returns p, the equality multipliers, the inequality multipliers, the working set and the iterations.
+    """
+    nx = len(grad)
+    nh = len(hx)
+    working = list(working)
+    lambdas_g = np.zeros(len(gx))
+    for it in range(max_iter):
+        na = nh + len(working)
+        jac = vstack_jacobians([dhx, dgx[working]])
+        cons = np.concatenate([hx, gx[working]])
+        p_x, lambdas = solver.solve(grad, jac, cons)
+        lambdas_h = lambdas[:nh]
+        lambdas_g[:] = 0
+        lambdas_g[working] = lambdas[nh:]
+
+        if len(working) > 0 and np.min(lambdas_g[working]) < 0:
+            working.remove(working[np.argmin(lambdas_g[working])])
+            continue
+        violation = dgx@p_x + gx
+        violation[working] = 0
+        if np.max(violation, initial=0) <= 1e-12:
+            break
+        i = int(np.argmax(violation))
+        row = dense(dgx[[i]])[0]
+        # a gradient that depends on the active ones would make the kkt system singular,
+        # so it swaps with the active inequality whose multiplier hits 0 first as it comes in
+        if sp.issparse(jac):
+            coefs = lsqr(jac.T, row, atol=1e-14, btol=1e-14)[0]
+        else:
+            coefs = np.linalg.lstsq(jac.T, row, rcond=None)[0]
+        if na < nx and np.linalg.norm(jac.T@coefs - row) > 1e-10*np.linalg.norm(row):
+            working.append(i)
+            continue
+        coefs_g = coefs[nh:]
+        blocking = coefs_g > 1e-12
+        if not np.any(blocking):
+            # the linearized constraints are inconsistent, take the closest step there is
+            break
+        ratios = np.full(len(working), np.inf)
+        ratios[blocking] = lambdas_g[working][blocking]/coefs_g[blocking]
+        working[int(np.argmin(ratios))] = i
+    return p_x, lambdas_h, lambdas_g, working, it + 1
+
+
+def QNSQP(problem: ConstrainedProblem, x0, tol_opt, tol_feas, options=None):
+    if options is None:
+        options = {}
+    if "uh" not in options:
+        # smallest penalty on the constraint violation in the merit function
+        options["uh"] = 1
+    if "step_init" not in options:
+        options["step_init"] = 1
+    if "max_iter" not in options:
+        options["max_iter"] = 100
+    if "max_qp_iter" not in options:
+        options["max_qp_iter"] = 50
+    if "kkt" not in options:
+        options["kkt"] = "auto"
+    if "linsearch" not in options:
+        # "merit" for the l1 merit function, "filter" for the filter
+        options["linsearch"] = "merit"
+
+    x_k = np.asarray(x0, dtype=float)
+    nx = len(x_k)
+    f, dx_f = problem.f(x_k), problem.df(x_k)
+    h, dx_h, g, dx_g = problem.constraints(x_k)
+    nh = len(h)
+    ng = len(g)
+    lambdas_h = np.zeros(nh)
+    lambdas_g = np.zeros(ng)
+    # inequalities treated as equalities in the qp, warm started from the previous iteration
+    working = []
+    # room for every constraint, the qp uses the leading rows that are active
+    solver = KKTSolver(nx, nh+ng, options["kkt"])
+    mu = options["uh"]
+    # the filter starts with an upper limit on the constraint violation
+    filter_set = [(1e4*max(1, violation(h, g)), -np.inf)]
+
+    def lagr_grad(dx_f, dx_h, dx_g):
+        return dx_f + dx_h.T@lambdas_h + dx_g.T@lambdas_g
+
+    def feasibility(h, g):
+        return max(np.linalg.norm(h, np.inf), np.max(g, initial=0))
+
+    dx_lagr = lagr_grad(dx_f, dx_h, dx_g)
     infnorm_lagr = np.linalg.norm(dx_lagr, np.inf)
-    infnorm_h = np.linalg.norm(h, np.inf)
+    infnorm_feas = feasibility(h, g)
     k = 0
 
     guesses = [x_k]
-    print(f"SQP start, lambda:{lambdas} guess:{x_k}")
+    qp_iters = []
+    # trial points evaluated by the line search in each iteration
+    evals = []
+    # print(f"SQP start, lambda:{lambdas_h} {lambdas_g} guess:{x_k}")
 
-    while (infnorm_lagr > tol_opt or infnorm_h > tol_feas) and k < 3:
-        if k == 0 or np.dot(dx_f, dx_f_prev) > 10:
-            # hess_lagr = 1/np.linalg.norm(dx_f) * np.identity(len(dx_f_prev))
-            hess_lagr = np.identity(nx)
-        else:
+    while (infnorm_lagr > tol_opt or infnorm_feas > tol_feas) and k < options["max_iter"]:
+        if k > 0:
             # 5.91
             s_k = x_k - x_k_prev
             # 5.48
-            dx_lagr = dx_f + dx_h.T@lambdas
-            dx_lagr_prev = dx_f_prev + dx_h_prev.T@lambdas
+            dx_lagr = lagr_grad(dx_f, dx_h, dx_g)
+            dx_lagr_prev = lagr_grad(dx_f_prev, dx_h_prev, dx_g_prev)
             y_k = dx_lagr - dx_lagr_prev
             sty = s_k.T@y_k
-            stHLs = s_k.T@hess_lagr@s_k
+            stHLs = s_k.T@solver.hess@s_k
             if sty < 0.2 * stHLs:
                 theta_k = (0.8 * stHLs) / (stHLs - sty)
             else:
                 theta_k = 1
-            r_k = theta_k*y_k + (1-theta_k)*hess_lagr@s_k
-            hess_lagr = hess_lagr - (np.outer(hess_lagr@s_k, s_k)@hess_lagr) / (
-                s_k.T@hess_lagr@s_k) + (np.outer(r_k, r_k))/(r_k.T@s_k)
-
-        # solve QP subproblem for p_x,p_lambda
-        # hess_lagr dh.T   | p_x      | -dx_lagr
-        # dh        0      | p_lambda | -h
-        col0 = np.vstack((hess_lagr, dx_h))
-        col1 = np.vstack(
-            (dx_h.T, np.zeros((dx_h.shape[0], dx_h.shape[0]))))
-        lhs = np.hstack((col0, col1))
-
-        rhs = np.hstack((-dx_lagr, -h))
-        sol = np.linalg.solve(lhs, rhs)
-        p_x = sol[0:nx]
-        p_lambda = sol[nx:]
-
-        lambdas += p_lambda
-        a = linsearch_bktrk_constr(func, x_k, p_x, f, np.dot(dx_f, p_x),
-                                   a_init, 1e-4, 0.5, func_h, uh)
+            r_k = theta_k*y_k + (1-theta_k)*solver.hess@s_k
+            solver.bfgs_update(s_k, r_k)
+
+        # solve QP subproblem for p_x and the new multipliers
+        p_x, lambdas_h, lambdas_g, working, qp_it = active_set_qp(
+            solver, dx_f, dx_h, h, dx_g, g, working, options["max_qp_iter"])
+        qp_iters.append(qp_it)
+
+        if options["linsearch"] == "filter":
+            a, f, cons_k, ev = linsearch_filter(problem, x_k, p_x, f, h, g, dx_f, options["step_init"],
+                                                1e-4, 0.5, filter_set)
+        else:
+            # the merit penalty has to outweigh the multipliers for p_x to be a descent direction
+            mu = max(mu, 1.05*np.max(np.abs(np.concatenate([lambdas_h, lambdas_g])), initial=0))
+            a, f, cons_k, ev = linsearch_bktrk_constr(problem, x_k, p_x, f, h, g, dx_f, options["step_init"],
+                                                      1e-4, 0.5, mu)
+        evals.append(ev)
         x_k_prev = x_k
         x_k = x_k + a*p_x
-        print(f"SQP k:{k}, lambda:{lambdas} guess:{x_k}")
+        # print(f"SQP k:{k}, lambda:{lambdas_h} {lambdas_g} guess:{x_k}")
         guesses.append(x_k)
         dx_f_prev = dx_f
-        f, dx_f = func(x_k)
         dx_h_prev = dx_h
-        h, dx_h = func_h(x_k)
-        dx_lagr = dx_f + dx_h.T@lambdas
+        dx_g_prev = dx_g
+        # the line search already evaluated f and the constraints at the new point
+        dx_f = problem.df(x_k)
+        h, dx_h, g, dx_g = cons_k
+        dx_lagr = lagr_grad(dx_f, dx_h, dx_g)
 
         infnorm_lagr = np.linalg.norm(dx_lagr, np.inf)
-        infnorm_h = np.linalg.norm(h, np.inf)
+        infnorm_feas = feasibility(h, g)
         k += 1
-    return guesses
+
+    output = {
+        'iterations': k,
+        'qp_iterations': np.array(qp_iters),
+        'evals': np.array(evals),
+        'guesses': np.array(guesses),
+        'success': infnorm_lagr <= tol_opt and infnorm_feas <= tol_feas,
+        'lambdas_h': lambdas_h,
+        'lambdas_g': lambdas_g,
+        'active': working,
+        'refactors': solver.refactors,
+    }
+    return x_k, output
 
 
-def linsearch_bktrk_constr(func, guess, dir, phi_0, dphi_0, step_init, suffdec, bktrk, func_h, uh):
+def linsearch_bktrk_constr(problem, guess, dir, f_0, h_0, g_0, df_0, step_init, suffdec, bktrk, mu):
     # backtracking line search
     step = step_init
-    # if constr is not None:
-    #     while constr(guess + dir*step) > 0:
-    #         step = bktrk * step
-
-    # phi_step, _, df_step = xphi(func, guess, dir, step)
-    phi_step = merit_fn(func, guess, dir, step, func_h, uh)
-    print(f"** backtrack ** step: {step}, phi_step: {phi_step}")
-    # steps = [step]
-    while phi_step > (phi_0 + suffdec * step * dphi_0):
+    phi_0 = f_0 + mu*violation(h_0, g_0)
+    # directional derivative of the l1 merit function along the sqp step
+    dphi_0 = np.dot(df_0, dir) - mu*violation(h_0, g_0)
+
+    phi_step, f_step, cons_step = merit_fn(problem, guess, dir, step, mu)
+    evals = 1
+    # print(f"** backtrack ** step: {step}, phi_step: {phi_step}")
+    while phi_step > (phi_0 + suffdec * step * dphi_0) and step > 1e-10:
         step = bktrk * step
-        # steps.append(step)
-        # if constr is not None:
-        #     while constr(guess + dir*step) > 0:
-        #         step = bktrk * step
-        # phi_step, _, df_step = xphi(func, guess, dir, step)
-        phi_step = merit_fn(func, guess, dir, step, func_h, uh)
+        phi_step, f_step, cons_step = merit_fn(problem, guess, dir, step, mu)
+        evals += 1
         # print(f"** backtrack ** step: {step}, fx: {phi_step}")
-    return step
+    return step, f_step, cons_step, evals
+
 
+def linsearch_filter(problem, guess, dir, f_0, h_0, g_0, df_0, step_init, suffdec, bktrk, filter_set):
+    """
+    Backtracking line search that accepts any step the filter does not dominate, a step must
+    either reduce the constraint violation or the objective compared to every filter entry,
+    so no penalty parameter has to be balanced against the multipliers.
+    filter_set is a list of (violation, f) pairs and gets the current point appended when the
+    accepted step mostly reduces the violation.
+    Returns the step, f and constraints at the accepted point, and the trial points evaluated.
+    """
+    # margins from Wachter and Biegler
+    gamma_theta = 1e-5
+    gamma_f = 1e-5
+    delta = 1
+    s_theta = 1.1
+    s_f = 2.3
+    theta_0 = violation(h_0, g_0)
+    dphi_0 = np.dot(df_0, dir)
+    step = step_init
+    evals = 0
+    while True:
+        x_step = guess + dir*step
+        f_step = problem.f(x_step)
+        cons_step = problem.constraints(x_step)
+        evals += 1
+        theta = violation(cons_step[0], cons_step[2])
+        if step <= 1e-10:
+            filter_set.append((theta_0, f_0))
+            break
+        if all(theta <= (1-gamma_theta)*theta_j or f_step <= f_j - gamma_f*theta_j
+               for theta_j, f_j in filter_set):
+            # when the step is mainly an objective decrease it has to satisfy armijo on f,
+            # otherwise it is enough to improve on the current point and it goes in the filter
+            if dphi_0 < 0 and step*(-dphi_0)**s_f > delta*theta_0**s_theta:
+                if f_step <= f_0 + suffdec*step*dphi_0:
+                    break
+            elif theta <= (1-gamma_theta)*theta_0 or f_step <= f_0 - gamma_f*theta_0:
+                filter_set.append((theta_0, f_0))
+                break
+        step = bktrk * step
+    return step, f_step, cons_step, evals
+
+
+def violation(h, g):
+    return np.linalg.norm(h, 1) + np.sum(np.maximum(g, 0))
 
-def merit_fn(f, x0, dir, step, f_h, uh):
+
+def merit_fn(problem, x0, dir, step, mu):
     x_step = x0 + dir*step
-    h, _ = f_h(x_step)
-    fx, _ = f(x_step)
-    return fx + uh*np.linalg.norm(h, 1)
+    cons = problem.constraints(x_step)
+    fx = problem.f(x_step)
+    return fx + mu*violation(cons[0], cons[2]), fx, cons
 
 
 if __name__ == "__main__":
     x0 = np.array([2, 1])
     tol_opt = 1e-3
     tol_feas = 1e-3
-    uh = 1
     # print(f"fx0 = {f_5_2(x0)}, hx0 = {h_5_2(x0)}")
-    guesses = QNSQP(x0, tol_opt, tol_feas, f_5_4, h_5_4, uh)
+    e5_4_eq = ConstrainedProblem(fn.e5_4_f, fn.e5_4_df,
+                                 h=fn.e5_4_g, dh=fn.e5_4_dg)
+    xopt, output_eq = QNSQP(e5_4_eq, x0, tol_opt, tol_feas)
+    print(f"Ex 5.4 equality: {xopt}, converged: {output_eq['success']}, iterations: {output_eq['iterations']}")
+
+    e5_4 = ConstrainedProblem(fn.e5_4_f, fn.e5_4_df,
+                              g=fn.e5_4_g, dg=fn.e5_4_dg)
+    xopt, output = QNSQP(e5_4, x0, 1e-6, 1e-6)
+    print(f"Ex 5.4 inequality: {xopt}, converged: {output['success']}, iterations: {output['iterations']}, "
+          f"qp iterations: {np.sum(output['qp_iterations'])}")
+
+    # the filter accepts steps the l1 merit function would backtrack on
+    print("problem\t\t\tline search\titerations\tevaluations")
+    for name, problem, x_start, tol in [("Ex 5.4 equality", e5_4_eq, x0, 1e-3),
+                                        ("Ex 5.4 inequality", e5_4, x0, 1e-6)]:
+        for linsearch in ["merit", "filter"]:
+            _, output = QNSQP(problem, x_start, tol, tol, {'linsearch': linsearch})
+            print(f"{name:24}{linsearch}\t\t{output['iterations']}\t\t{np.sum(output['evals'])}"
+                  f"{'' if output['success'] else ', not converged'}")
+
+    p4_2 = ConstrainedProblem(fn.p42_f, fn.p42_df, g=fn.p42_g, dg=fn.p42_dg,
+                              lb=[0.005, 0.002])
+    xopt, output = QNSQP(p4_2, np.array([0.013, 0.004]), 1e-6, 1e-6)
+    print(f"Cantilever: {xopt}, converged: {output['success']}, iterations: {output['iterations']}, "
+          f"active: {output['active']}")
 
-    plot_constrained_opt(pf_5_4, ph_5_4, guesses,
+    plot_constrained_opt(pf_5_4, ph_5_4, output_eq['guesses'],
                          "Ex 4.5 contour with constraints and optimization path")
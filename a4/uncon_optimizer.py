@@ -6,8 +6,15 @@ but make sure you do not change the function signature (i.e., function name `unc
 The autograder will import `uncon_optimizer` from this file. If you change the function signature, the autograder will fail.
 """
 
+import os
+import sys
+
 import numpy as np
 
+# the root finders in rootfind are shared with the other assignments
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lib"))
+import rootfind  # noqa: E402
+
 
 def uncon_optimizer(func, x0, epsilon_g, options=None):
     """An algorithm for unconstrained optimization.
@@ -70,16 +77,26 @@ def uncon_optimizer(func, x0, epsilon_g, options=None):
         options["suffcur"] = 0.5
     if "stepinc" not in options:
         options["stepinc"] = 2
+    if "max_iter" not in options:
+        options["max_iter"] = np.inf
 
     constraint = None
     if 'constraint' in options:
+        # c(x) <= 0, a scalar or a vector, the backtracking line search keeps the guesses inside it
         constraint = options['constraint']
+    if "constraint_linear" not in options:
+        options["constraint_linear"] = False
+
+    # quasi-newton state from a previous, similar problem, see output['inv_hess'] and output['step']
+    warm_start = options["direction"] == "bfgs" and options.get('inv_hess') is not None
 
     # TODO: Your code goes here!
     it = 0
     guess = x0
     guess_prev = guess
     step = options["step_init"]
+    if warm_start and options.get('step', 0) > 0:
+        step = options['step']
 
     f, df = func(guess)
     df_infnorm = np.linalg.norm(df, np.inf)
@@ -87,25 +104,41 @@ def uncon_optimizer(func, x0, epsilon_g, options=None):
     df_prev = df
     dir_prev = dir_steepdesc(df)
     inv_hess = 1/np.linalg.norm(df) * np.identity(len(x0))
+    if warm_start:
+        inv_hess = options['inv_hess']
 
     # lists to keep track of function values
     infnorm = [df_infnorm]
     guesses = [guess]
-    while df_infnorm > epsilon_g:
+    while df_infnorm > epsilon_g and it < options["max_iter"]:
         # print(f"it: {it}, infnorm: {df_infnorm}")
         # print(
         #     f"it: {it}, step: {step}, dir: {dir_prev}, guess: {guess}, f: {f}, df: {df}")
-        dir, inv_hess = get_dir(
-            options["direction"], df, df_prev, it, dir_prev, guess, guess_prev, inv_hess)
+        if it == 0 and warm_start:
+            # keep the inverse hessian instead of resetting it to a scaled identity
+            dir = -np.matmul(inv_hess, df)
+        else:
+            dir, inv_hess = get_dir(
+                options["direction"], df, df_prev, it, dir_prev, guess, guess_prev, inv_hess)
 
         phi_0 = f
         dphi_0 = np.dot(df, dir)
-        if options["linsearch"] == 'bracket':
+        if it == 0 and warm_start:
+            # the last accepted step of the previous problem suits the carried model
+            step_init = step
+        elif warm_start and options["linsearch"] == 'bracket':
+            # a carried quasi-newton model is already scaled, so try the full step
+            step_init = 1
+        elif options["linsearch"] == 'bracket':
             step_init = step*(np.dot(df_prev, dir_prev))/(np.dot(df, dir))
         else:
             step_init = options["step_init"]
+        if not step_init > 0:
+            # a collapsed previous step would keep every following bracket stuck at zero
+            step_init = options["step_init"]
         step, f, new_df = get_step(options["linsearch"], func, guess, dir, phi_0, dphi_0, step_init,
-                                   options["suffdec"], options["bktrk"], options["suffcur"], options["stepinc"], constraint)
+                                   options["suffdec"], options["bktrk"], options["suffcur"], options["stepinc"], constraint,
+                                   options["constraint_linear"])
 
         guess_prev = guess
         guess = guess + step * dir
@@ -121,6 +154,12 @@ def uncon_optimizer(func, x0, epsilon_g, options=None):
     output['infnorm'] = np.array(infnorm)
     output['guesses'] = np.array(guesses)
     output['iterations'] = it
+    # quasi-newton state, can be passed back in through options to warm start a similar problem
+    output['inv_hess'] = inv_hess
+    output['step'] = step
+    # instrumented functions (like lib/instrument.py FevWrapper) keep their own evaluation summary
+    if hasattr(func, 'summary'):
+        output['fev_summary'] = func.summary(it)
 
     return guess, f, output
 
@@ -162,6 +201,9 @@ def dir_bfgs(df, df_prev, it, dir_prev, x, x_prev, inv_hess_prev):
     else:
         s = np.array(x) - np.array(x_prev)
         y = np.array(df) - np.array(df_prev)
+        if np.dot(s, y) <= 0:
+            # no curvature information in this step (e.g. a zero step), keep the old model
+            return -np.matmul(inv_hess_prev, df), inv_hess_prev
         sigma = 1/(np.dot(s, y))
         inv_hess = (id - sigma*np.outer(s, y)) @ inv_hess_prev @ \
             (id - sigma*np.outer(y, s)) + (sigma * np.outer(s, s))
@@ -170,21 +212,21 @@ def dir_bfgs(df, df_prev, it, dir_prev, x, x_prev, inv_hess_prev):
 
 # line search functions
 
-def get_step(lin_option, func, x, dir, phi_0, dphi_0, step_init, suffdec, bktrk, suffcur, stepinc, constr):
+def get_step(lin_option, func, x, dir, phi_0, dphi_0, step_init, suffdec, bktrk, suffcur, stepinc, constr,
+             constr_linear=False):
     if lin_option == "backtrack":
-        return linsearch_bktrk(func, x, dir, phi_0, dphi_0, step_init, suffdec, bktrk, constr)
+        return linsearch_bktrk(func, x, dir, phi_0, dphi_0, step_init, suffdec, bktrk, constr, constr_linear)
     elif lin_option == "bracket":
         return linsearch_bracket(func, x, dir, phi_0, dphi_0, step_init, suffdec, suffcur, stepinc)
     else:
         return linsearch_bracket(func, x, dir, phi_0, dphi_0, step_init, suffdec, suffcur, stepinc)
 
 
-def linsearch_bktrk(func, guess, dir, phi_0, dphi_0, step_init, suffdec, bktrk, constr):
+def linsearch_bktrk(func, guess, dir, phi_0, dphi_0, step_init, suffdec, bktrk, constr, constr_linear=False):
     # backtracking line search
     step = step_init
     if constr is not None:
-        while constr(guess + dir*step) > 0:
-            step = bktrk * step
+        step = max_feasible_step(constr, guess, dir, step, constr_linear)
 
     phi_step, _, df_step = xphi(func, guess, dir, step)
     # print(f"** backtrack ** step: {step}, phi_step: {phi_step}")
@@ -195,6 +237,43 @@ def linsearch_bktrk(func, guess, dir, phi_0, dphi_0, step_init, suffdec, bktrk,
     return step, phi_step, df_step
 
 
+def max_feasible_step(constr, guess, dir, step_max, linear=False, frac=0.99, samples=16):
+    """
+    Largest step up to step_max that keeps every constraint c(guess + dir*step) <= 0, backed off
+    to frac of the way to the boundary so barriers stay finite. Constraints that guess already
+    violates can't be kept and are ignored, if it violates all of them step_max is returned.
+    Linear constraints change by step*(c(guess + dir) - c(guess)), so the boundary is found
+    exactly from 2 evaluations. Otherwise max(c) is sampled at samples points along the step to
+    bracket its first crossing, which rootfind.brent then pinpoints. A constraint that leaves and comes
+    back between two samples is missed, more samples make that less likely.
+    """
+    c_max = np.atleast_1d(constr(guess + dir*step_max))
+    if np.all(c_max <= 0):
+        return step_max
+    c_0 = np.atleast_1d(constr(guess))
+    kept = c_0 <= 0
+    if not np.any(kept):
+        return step_max
+    if linear:
+        rate = (c_max - c_0)/step_max
+        hit = kept & (rate > 0)
+        if not np.any(hit):
+            return step_max
+        return frac*min(step_max, np.min(-c_0[hit]/rate[hit]))
+
+    @np.vectorize
+    def worst(step):
+        return np.max(np.atleast_1d(constr(guess + dir*step))[kept])
+    # the first sample past the boundary brackets the first crossing with the one before it
+    steps = np.linspace(0, step_max, samples + 1)
+    lo = 0
+    for step in steps[1:]:
+        if worst(step) > 0:
+            return frac*rootfind.brent(worst, lo, step, xtol=1e-8*step_max)[0]
+        lo = step
+    return step_max
+
+
 # bracketing
 def linsearch_bracket(func, guess, dir, phi_0, dphi_0, step_init, suffdec, suffcur, stepinc):
     step_1 = 0
@@ -1,6 +1,12 @@
 #!/usr/bin/env python
+import os
+import sys
+
 import numpy as np
 
+# the root finders in rootfind are shared with the other assignments
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lib"))
+
 # problem 5.1
 
 
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+import numpy as np
+
+
+def implicit_solve(solve, dr_du, dr_dx, x, df_du=None, df_dx=None, mode="direct"):
+    """
+    Solves r(u, x) = 0 for the state u and differentiates through the solution with the
+    implicit function theorem, du/dx = -(dr/du)^-1 dr/dx, so the solver never has to be rerun
+    for the derivative. With df_du and df_dx it returns the total derivative of f(u, x) instead,
+    df/dx = df/dx + df/du du/dx, which is where the adjoint mode pays off for few outputs.
+
+    solve(x) returns u, the partials are functions of (u, x). If dr_du returns a scalar or 1d
+    array the residuals are independent (like a batch of kepler solves) and everything is
+    elementwise, otherwise they are jacobians and it takes one linear solve:
+    - "direct" solves dr/du phi = dr/dx, one right hand side per parameter.
+    - "adjoint" solves dr/du.T psi = df/du.T, one right hand side per output.
+
+    Returns u and du/dx, or u and df/dx when the partials of f are given.
+    Since the result is just a derivative of u wrt x, a nested solver can use it as its own dr_dx.
+    """
+    u = solve(x)
+    A = dr_du(u, x)
+    B = dr_dx(u, x)
+    with_f = df_du is not None
+
+    if np.ndim(A) <= 1:
+        du_dx = -B/A
+        if not with_f:
+            return u, du_dx
+        return u, df_dx(u, x) + df_du(u, x)*du_dx
+
+    if not with_f:
+        return u, -np.linalg.solve(A, B)
+    fu = np.atleast_2d(df_du(u, x))
+    fx = np.atleast_2d(df_dx(u, x))
+    if mode == "adjoint":
+        psi = np.linalg.solve(A.T, fu.T)
+        return u, fx - psi.T@B
+    return u, fx - fu@np.linalg.solve(A, B)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+import os
+from time import perf_counter
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+import functions as fn
+import rootfind  # found through the lib path functions adds
+
+
+def mikkola_starter(M, e):
+    """
+    Mikkola's (1987) cubic approximation of E for M in [-pi, pi], within about 1e-3 everywhere
+    so halley's method only needs one or two updates from it.
+    """
+    denom = 4*e + 0.5
+    alpha = (1 - e)/denom
+    beta = M/(2*denom)
+    z = np.cbrt(beta + np.sign(beta)*np.sqrt(beta**2 + alpha**3))
+    # z is 0 only when M is 0 and e is 1, where E is 0 as well
+    s = np.where(z != 0, z - alpha/np.where(z != 0, z, 1), 0)
+    s = s - 0.078*s**5/(1 + e)
+    return M + e*(3*s - 4*s**3)
+
+
+def _kepler_res(E, M, e):
+    return E - e*np.sin(E) - M
+
+
+def _kepler_dres(E, M, e):
+    return 1 - e*np.cos(E)
+
+
+def _kepler_d2res(E, M, e):
+    return e*np.sin(E)
+
+
+def _fixed_pt_dres(E, M, e):
+    # a unit derivative turns the newton step into the fixed point update E = M + e sin(E)
+    return np.ones_like(E)
+
+
+def solve_kepler(M, e=fn.ECCENTRICITY, E0=None, tol=1e-12, max_iters=50, method="halley"):
+    """
+    Solves kepler's equation E - e sin(E) = M for a whole array of mean anomalies at once with
+    rootfind.newton. M and e are broadcast together, so a column of eccentricities against a
+    row of mean anomalies solves every combination in one call. Each element stops once its
+    residual is below tol, only the ones still moving are evaluated.
+    method is "halley" (third order), "newton" or "fixed_pt" (E = M + e sin(E)). Without E0
+    halley starts from mikkola_starter and the others from pi, where newton always converges.
+
+    Returns E with the broadcast shape, the updates each element took and whether it converged.
+    """
+    M, e = np.broadcast_arrays(np.asarray(M, dtype=float),
+                               np.asarray(e, dtype=float))
+    # solve in [0, 2pi) and shift back, E - M is periodic in M
+    M_red = np.mod(M, 2*np.pi)
+    shift = M - M_red
+    if E0 is not None:
+        E = np.broadcast_to(E0, M.shape) - shift
+    elif method == "halley":
+        # the starter wants M in [-pi, pi]
+        upper = M_red > np.pi
+        E = mikkola_starter(M_red - 2*np.pi*upper, e) + 2*np.pi*upper
+    else:
+        E = np.full(M.shape, np.pi)
+
+    # xtol=0 leaves the residual as the only stopping test
+    E, output = rootfind.newton(_kepler_res, _fixed_pt_dres if method == "fixed_pt" else _kepler_dres,
+                                E, args=(M_red, e), xtol=0, ftol=tol, max_iters=max_iters,
+                                d2f=_kepler_d2res if method == "halley" else None)
+    return E + shift, output['iters'], output['converged']
+
+
+class KeplerTable:
+    """
+    Lookup table for E(M) at a fixed eccentricity, for hot loops where even the vectorized
+    solver is too much. Nodes are uniform in E, so M = E - e sin(E) and dE/dM = 1/(1 - e cos(E))
+    are explicit and building the table needs no solves, and they crowd towards M = 0 where E(M)
+    is steepest at high eccentricity. E is cubic hermite interpolated over [0, pi], mirrored
+    for (pi, 2pi), then polished with one newton step. Anything whose next newton step would
+    still be above tol (the same step check as rootfind.newton) is finished by solve_kepler.
+
+    Parameters:
+    - e (float): eccentricity.
+    - nodes (int): table size, M and dE are stored at this many nodes, E is rebuilt from it.
+    - tol (float): newton step size that has to be reached.
+    - cache (str): optional directory to save the table in and load it from.
+    """
+
+    def __init__(self, e, nodes=1024, tol=1e-12, cache=None):
+        self.e = e
+        self.tol = tol
+        # elements the last call had to hand over to solve_kepler
+        self.fallbacks = 0
+        # the nodes themselves are uniform, only M and dE/dM at them are stored
+        self.E = np.linspace(0, np.pi, nodes)
+        path = None
+        if cache is not None:
+            path = os.path.join(cache, f"kepler_table_e{float(e)!r}_n{nodes}.npz")
+            if os.path.exists(path):
+                table = np.load(path)
+                self.M, self.dE = table["M"], table["dE"]
+                return
+        self.M = self.E - e*np.sin(self.E)
+        self.dE = 1/(1 - e*np.cos(self.E))
+        if path is not None:
+            os.makedirs(cache, exist_ok=True)
+            np.savez(path, M=self.M, dE=self.dE)
+
+    def __call__(self, M):
+        M = np.asarray(M, dtype=float)
+        M_red = np.mod(M, 2*np.pi)
+        upper = M_red > np.pi
+        M_half = np.where(upper, 2*np.pi - M_red, M_red)
+
+        i = np.clip(np.searchsorted(self.M, M_half) - 1, 0, len(self.M) - 2)
+        h = self.M[i+1] - self.M[i]
+        t = (M_half - self.M[i])/h
+        t2 = t*t
+        t3 = t2*t
+        E = (2*t3 - 3*t2 + 1)*self.E[i] + (t3 - 2*t2 + t)*h*self.dE[i] + \
+            (-2*t3 + 3*t2)*self.E[i+1] + (t3 - t2)*h*self.dE[i+1]
+        E = np.where(upper, 2*np.pi - E, E)
+
+        E = E - (E - self.e*np.sin(E) - M_red)/(1 - self.e*np.cos(E))
+        # the newton step the polished E would still take, has to be below tol like in rootfind.newton
+        step = (E - self.e*np.sin(E) - M_red)/(1 - self.e*np.cos(E))
+        slow = np.abs(step) > self.tol
+        self.fallbacks = int(np.count_nonzero(slow))
+        if self.fallbacks > 0:
+            E[slow] = solve_kepler(M_red[slow], self.e, E0=E[slow], tol=self.tol)[0]
+        return E + (M - M_red)
+
+
+if __name__ == "__main__":
+    # E versus M for several eccentricities in a single call
+    eccs = np.array([0, 0.1, 0.5, 0.9])
+    M = np.linspace(0, 2*np.pi, 1000)
+    E, iters, converged = solve_kepler(M[None, :], eccs[:, None])
+    print(f"E vs M sweep: converged: {np.all(converged)}, max iterations: {np.max(iters)}")
+    _, ax = plt.subplots()
+    for ecc, E_ecc in zip(eccs, E):
+        ax.plot(M, E_ecc, label=f"e = {ecc}")
+    ax.set_xlabel("M")
+    ax.set_ylabel("E")
+    ax.legend()
+    plt.title("Eccentric anomaly vs mean anomaly")
+    plt.show()
+
+    # a batch of anomalies like an orbit propagation would need
+    rng = np.random.default_rng(0)
+    M = rng.uniform(0, 2*np.pi, 1_000_000)
+    for method in ["newton", "halley"]:
+        start = perf_counter()
+        E, iters, converged = solve_kepler(M, 0.7, method=method)
+        elapsed = perf_counter() - start
+        residual = np.max(np.abs(fn.kepler_f(E, M)))
+        print(f"{method}: {M.size} anomalies in {elapsed:.3f} s, converged: {np.all(converged)}, "
+              f"mean iterations: {np.mean(iters):.2f}, max residual: {residual:.2e}")
+
+    # fixed eccentricity hot loop, table built once
+    table = KeplerTable(0.7)
+    start = perf_counter()
+    E = table(M)
+    elapsed = perf_counter() - start
+    residual = np.max(np.abs(fn.kepler_f(E, M)))
+    print(f"table: {M.size} anomalies in {elapsed:.3f} s, fallbacks: {table.fallbacks}, "
+          f"max residual: {residual:.2e}")
+
+    # iterations over the eccentricity range, newton and fixed point start from E = 1 like the old newton_iter
+    eccs = np.linspace(0, 0.99, 100)
+    M = np.linspace(0, 2*np.pi, 1000)
+    print("method\t\t\tmean iters\tmax iters\ttime")
+    for name, kwargs in [("fixed point, E0 = 1", {"method": "fixed_pt", "E0": 1, "max_iters": 5000}),
+                         ("newton, E0 = 1", {"method": "newton", "E0": 1}),
+                         ("newton, E0 = pi", {"method": "newton"}),
+                         ("halley, mikkola starter", {"method": "halley"})]:
+        start = perf_counter()
+        E, iters, converged = solve_kepler(M[None, :], eccs[:, None], **kwargs)
+        elapsed = perf_counter() - start
+        print(f"{name:24}{np.mean(iters):.2f}\t\t{np.max(iters)}\t\t{elapsed:.3f} s"
+              f"{'' if np.all(converged) else ', not all converged'}")
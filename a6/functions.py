@@ -1,21 +1,12 @@
-import numpy as np
-from scipy.interpolate import RegularGridInterpolator
+import os
+import sys
 
+import numpy as np
 
-class FevWrapper:
-    def __init__(self, f):
-        self._f = f
-        self._fev = 0
+# FevWrapper and ConvergenceRate are shared with the other assignments
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lib"))
+from instrument import ConvergenceRate, FevWrapper  # noqa: E402,F401
 
-    def __call__(self, x):
-        self._fev += 1
-        return self._f(x)
-
-    def get_fev(self):
-        """
-        Returns the number of function calls made.
-        """
-        return self._fev
 
 # 6.2.a
 
@@ -68,37 +59,118 @@ def bean_df(x):
 # 6.2.b
 
 
+class TiledNoiseField:
+    """
+    Gaussian noise on a regular 2D grid, interpolated bilinearly between the grid nodes.
+
+    The grid is split into square tiles that are only drawn the first time a point inside them is evaluated,
+    so an optimizer that stays in a small region never pays for the rest of the grid.
+    Every tile gets its own generator seeded from (seed, tile index), which keeps the field the same
+    no matter which order the tiles are drawn in.
+
+    Parameters:
+    - noise (float): The standard deviation of the noise at each grid node.
+    - spacing (float): The distance between grid nodes.
+    - origin (list, optional): The position of grid node (0, 0). Defaults to [0, 0].
+    - tile (int, optional): The number of grid nodes along each side of a tile. Defaults to 64.
+    - seed (int, optional): The seed for the field. A random one is picked if not given.
+    """
+
+    def __init__(self, noise, spacing, origin=[0, 0], tile=64, seed=None) -> None:
+        self.noise = noise
+        self.spacing = spacing
+        self.origin = np.asarray(origin, dtype=float)
+        self.tile = tile
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self._tiles = {}
+
+    def __tile(self, i, j):
+        if (i, j) not in self._tiles:
+            # seed sequences only take non-negative entropy, so fold negative tile indices onto odd numbers
+            rng = np.random.default_rng(
+                [self.seed, 2*i if i >= 0 else -2*i - 1, 2*j if j >= 0 else -2*j - 1])
+            self._tiles[(i, j)] = rng.normal(0, self.noise, (self.tile, self.tile))
+        return self._tiles[(i, j)]
+
+    def __nodes(self, n1, n2):
+        t1, l1 = np.divmod(n1, self.tile)
+        t2, l2 = np.divmod(n2, self.tile)
+        values = np.empty(n1.shape)
+        for i, j in set(zip(t1.tolist(), t2.tolist())):
+            in_tile = (t1 == i) & (t2 == j)
+            values[in_tile] = self.__tile(i, j)[l1[in_tile], l2[in_tile]]
+        return values
+
+    def tiles(self):
+        """
+        Returns the number of tiles drawn so far.
+        """
+        return len(self._tiles)
+
+    def value_grad(self, x):
+        """
+        Calculate the noise and its gradient at the given positions.
+
+        Parameters:
+        - x (ndarray): The position with shape (2,), or k positions with shape (2, k).
+
+        Returns:
+        - tuple: The noise with shape () or (k,) and its gradient with shape (2,) or (2, k).
+        """
+        x = np.asarray(x, dtype=float)
+        u = (x.reshape(2, -1) - self.origin[:, None]) / self.spacing
+        n = np.floor(u).astype(int)
+        t1, t2 = u - n
+        n1, n2 = n
+
+        # the 4 corners of every cell are looked up in a single pass
+        corners = self.__nodes(np.concatenate((n1, n1 + 1, n1, n1 + 1)),
+                               np.concatenate((n2, n2, n2 + 1, n2 + 1)))
+        v00, v10, v01, v11 = corners.reshape(4, -1)
+
+        value = (1-t1)*(1-t2)*v00 + t1*(1-t2)*v10 + (1-t1)*t2*v01 + t1*t2*v11
+        grad = np.array([(1-t2)*(v10 - v00) + t2*(v11 - v01),
+                         (1-t1)*(v01 - v00) + t1*(v11 - v10)]) / self.spacing
+
+        return value.reshape(x.shape[1:]), grad.reshape(x.shape)
+
+    def __call__(self, x):
+        return self.value_grad(x)[0]
+
+
 class BeanNoisyPredictable:
     """
     A class representing a bean with noisy and predictable behavior.
 
+    The noise is a TiledNoiseField with the same node spacing as a grid x grid mesh over the span,
+    so only the tiles around the path of the optimizer are ever generated.
+    The noise also continues outside of the span instead of failing there.
+
     Parameters:
     - noise (float): The standard deviation of the noise added to the bean's behavior.
     - x0 (list, optional): The initial position of the bean. Defaults to [0, 0].
     - span (float, optional): The span of the bean's behavior. Defaults to 10.
     - grid (int, optional): The number of points in the grid used to generate the noise mesh. Defaults to 1000.
+    - seed (int, optional): The seed for the noise. A random one is picked if not given.
     """
 
-    def __init__(self, noise, x0=[0, 0], span=10, grid=1000) -> None:
-        self.noise = self.__generate_noise_mesh(noise, x0, span, grid)
-
-    def __generate_noise_mesh(self, noise, x0, span, grid):
-        x1 = np.linspace(x0[0]-span, x0[0]+span, grid)
-        x2 = np.linspace(x0[1]-span, x0[1]+span, grid)
-        noise_mesh = np.random.normal(0, noise, (grid, grid))
-        return RegularGridInterpolator((x1, x2), noise_mesh)
+    def __init__(self, noise, x0=[0, 0], span=10, grid=1000, seed=None) -> None:
+        origin = [x0[0]-span, x0[1]-span]
+        self.noise = TiledNoiseField(noise, 2*span/(grid-1), origin, seed=seed)
 
     def f(self, x):
         """
         Calculate the value of the bean's behavior at a given position.
 
         Parameters:
-        - x (list): The position at which to evaluate the bean's behavior.
+        - x (list): The position at which to evaluate the bean's behavior, or positions stacked along the columns.
 
         Returns:
         - float: The value of the bean's behavior at the given position.
         """
-        return bean_f(x) + self.noise(x)[0]
+        return bean_f(x) + self.noise(x)
 
     def df(self, x):
         """
@@ -110,16 +182,7 @@ class BeanNoisyPredictable:
         Returns:
         - numpy.ndarray: The gradient of the bean's behavior at the given position.
         """
-        fd_step = 1e-6
-        noise_g = np.zeros(2)
-
-        h = [fd_step, 0]
-        noise_g[0] = (self.noise(x+h) - self.noise(x-h))/(2*fd_step)
-
-        h = [0, fd_step]
-        noise_g[1] = (self.noise(x+h) - self.noise(x-h))/(2*fd_step)
-
-        return bean_df(x) + noise_g
+        return bean_df(x) + self.noise.value_grad(x)[1]
 
     def fdf(self, x):
         """
@@ -131,7 +194,8 @@ class BeanNoisyPredictable:
         Returns:
         - tuple: A tuple containing the value and gradient of the bean's behavior at the given position.
         """
-        return self.f(x), self.df(x)
+        noise, noise_g = self.noise.value_grad(x)
+        return bean_f(x) + noise, bean_df(x) + noise_g
 
 # 6.2.c
 
@@ -209,20 +273,17 @@ def rosenbrock_nd_f(x):
 
     Parameters
     ----------
-    x : ndarray
-        design variables
+    x : ndarray, shape (n,) or (n, k)
+        design variables, or k points stacked along the columns like the [x1, x2] meshgrids
 
     Returns
     -------
-    f : float
+    f : float or ndarray, shape (k,)
         function value
     """
-    n = len(x)
-    f = 0
-    for i in range(n - 1):
-        f += 100*(x[i + 1] - x[i]**2)**2 + (1 - x[i])**2
-
-    return f
+    x = np.asarray(x)
+    t = x[1:] - x[:-1]**2
+    return np.sum(100*t**2 + (1 - x[:-1])**2, axis=0)
 
 
 def rosenbrock_nd_df(x):
@@ -233,24 +294,44 @@ def rosenbrock_nd_df(x):
 
     Parameters
     ----------
-    x : ndarray
-        design variables
+    x : ndarray, shape (n,) or (n, k)
+        design variables, or k points stacked along the columns
 
     Returns
     -------
-    g : ndarray
+    g : ndarray, shape (n,) or (n, k)
         objective gradient
     """
-    n = len(x)
-
-    g = np.zeros(n)
-    for i in range(n):
-        if i == 0:  # no n-1 term
-            g[i] = -400*x[i]*(x[i+1]-x[i]**2) + 2*(x[i]-1)
-        elif i == n-1:  # no n+1 term
-            g[i] = 200*(x[i]-x[i-1]**2)
-        else:
-            g[i] = -400*x[i]*(x[i+1]-x[i]**2) + 2 * \
-                (x[i]-1) + 200*(x[i]-x[i-1]**2)
+    return rosenbrock_nd_fdf(x)[1]
 
-    return g
+
+def rosenbrock_nd_fdf(x):
+    """
+    Rosenbrock function and its gradient from Appendix D of the book, sharing the intermediate terms
+
+    Parameters
+    ----------
+    x : ndarray, shape (n,) or (n, k)
+        design variables, or k points stacked along the columns
+
+    Returns
+    -------
+    f : float or ndarray, shape (k,)
+        function value
+    g : ndarray, shape (n,) or (n, k)
+        objective gradient
+    """
+    x = np.asarray(x)
+    # integer points become float, complex ones stay complex for the complex step
+    x = x.astype(np.result_type(x, float))
+    # x[i+1] - x[i]**2 and 1 - x[i] show up in both f and g
+    t = x[1:] - x[:-1]**2
+    u = 1 - x[:-1]
+    f = np.sum(100*t**2 + u**2, axis=0)
+
+    g = np.zeros_like(x)
+    # no n-1 term for the first and no n+1 term for the last
+    g[:-1] = -400*x[:-1]*t - 2*u
+    g[1:] += 200*t
+
+    return f, g
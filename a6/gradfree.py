@@ -1,3 +1,4 @@
+import heapq
 import numpy as np
 import math
 from matplotlib import pyplot as plt
@@ -62,7 +63,23 @@ def range_f(simplex) -> float:
     return np.max(fxarray) - np.min(fxarray)
 
 
-def nelder_mead(f, guess, l=1, tau_x=1e-6, tau_f=1e-6, max_iter=100):
+def attach_summary(f, output):
+    """
+    Attach the evaluation summary of f to an optimizer output, if f keeps one (like functions.FevWrapper).
+
+    Args:
+      f: The function the optimizer was run on.
+      output: The output dictionary of the optimizer, must have 'iters'.
+
+    Returns:
+      The same output dictionary.
+    """
+    if hasattr(f, 'summary'):
+        output['fev_summary'] = f.summary(output['iters'])
+    return output
+
+
+def nelder_mead(f, guess, l=1, tau_x=1e-6, tau_f=1e-6, max_iter=100, history=True, callback=None):
     """
     Nelder-Mead algorithm for finding the minimum of a function.
 
@@ -73,9 +90,12 @@ def nelder_mead(f, guess, l=1, tau_x=1e-6, tau_f=1e-6, max_iter=100):
       tau_x: tolerance for change in x
       tau_f: tolerance for change in f
       max_iter: The maximum number of iterations to run the algorithm.
+      history: Keep every simplex, otherwise only the first and the last.
+      callback: Called with the simplex size delta_x after every iteration,
+        e.g. a lib/instrument.py ConvergenceRate.
 
     Returns:
-      An output dictionary with all the simplexes and the iterations taken.
+      An output dictionary with the simplexes and the iterations taken.
     """
 
     # Create a simplex with edge length l
@@ -156,7 +176,12 @@ def nelder_mead(f, guess, l=1, tau_x=1e-6, tau_f=1e-6, max_iter=100):
                         simplex[j].set(node, f(node))
 
         iters += 1
-        simplex_list.append(np.array(deepcopy(simplex)))
+        if history or len(simplex_list) == 1:
+            simplex_list.append(np.array(deepcopy(simplex)))
+        else:
+            simplex_list[-1] = np.array(deepcopy(simplex))
+        if callback is not None:
+            callback(delta_x(simplex))
 
     # Return the output
     output = {
@@ -164,7 +189,328 @@ def nelder_mead(f, guess, l=1, tau_x=1e-6, tau_f=1e-6, max_iter=100):
         'iters': iters,
         'success': iters < max_iter
     }
-    return output
+    return attach_summary(f, output)
+
+
+def eval_population(f, pop, vectorized=False):
+    """
+    Evaluate the function at every member of a population.
+
+    Args:
+      f: The function to evaluate.
+      pop: ndarray of shape (k, n), one point per row.
+      vectorized: If True, f is called once for the whole population as f(pop.T),
+        the same way the contour plots call f([x1, x2]). Otherwise f is called once per point.
+
+    Returns:
+      ndarray of shape (k,) with the function value of each point.
+    """
+    if vectorized:
+        return np.asarray(f(pop.T), dtype=float).reshape(len(pop))
+    return np.array([f(x) for x in pop], dtype=float)
+
+
+def genetic_algorithm(f, lb, ub, pop_size=40, max_iter=200, p_cross=0.9, p_mut=None,
+                      eta_mut=0.1, elite=2, tau_f=1e-6, stall_iter=30, vectorized=False, seed=None):
+    """
+    Real-encoded genetic algorithm for finding the minimum of a function.
+
+    Args:
+      f: The function to minimize.
+      lb: lower bounds of the design variables.
+      ub: upper bounds of the design variables.
+      pop_size: number of members in the population.
+      max_iter: The maximum number of generations to run the algorithm.
+      p_cross: probability of crossover for each pair of parents.
+      p_mut: probability of mutating each design variable, 1/n by default.
+      eta_mut: standard deviation of the mutation as a fraction of (ub - lb).
+      elite: number of best members carried over unchanged to the next generation.
+      tau_f: tolerance for change in the best f
+      stall_iter: stop when the best f has not improved by tau_f for this many generations.
+      vectorized: evaluate each generation with a single call f(pop.T), see eval_population.
+      seed: seed for the random number generator.
+
+    Returns:
+      An output dictionary with the optimum, the best point of every generation and the iterations taken.
+    """
+    rng = np.random.default_rng(seed)
+    lb = np.asarray(lb, dtype=float)
+    ub = np.asarray(ub, dtype=float)
+    n = len(lb)
+    if p_mut is None:
+        p_mut = 1/n
+    # keep the population even so parents can be paired up
+    pop_size += pop_size % 2
+
+    pop = lb + rng.random((pop_size, n)) * (ub - lb)
+    fpop = eval_population(f, pop, vectorized)
+
+    best = np.argmin(fpop)
+    guesses = [pop[best].copy()]
+    fbest = [fpop[best]]
+    iters = 0
+    stall = 0
+    while iters < max_iter and stall < stall_iter:
+        # binary tournament selection
+        a, b = rng.integers(0, pop_size, (2, pop_size))
+        parents = pop[np.where(fpop[a] < fpop[b], a, b)]
+
+        # linear crossover between consecutive parents
+        p1, p2 = parents[0::2], parents[1::2]
+        cross = rng.random((pop_size//2, 1)) < p_cross
+        w = rng.random((pop_size//2, 1))
+        c1 = np.where(cross, w*p1 + (1-w)*p2, p1)
+        c2 = np.where(cross, (1-w)*p1 + w*p2, p2)
+        children = np.vstack((c1, c2))
+
+        # gaussian mutation, kept inside the bounds
+        mut = rng.random((pop_size, n)) < p_mut
+        children += mut * rng.normal(0, eta_mut, (pop_size, n)) * (ub - lb)
+        children = np.clip(children, lb, ub)
+
+        # the whole generation is evaluated as one batch
+        fchildren = eval_population(f, children, vectorized)
+
+        # elitism, the best of the old population replace the worst children
+        old_best = np.argsort(fpop)[:elite]
+        new_worst = np.argsort(fchildren)[pop_size-elite:]
+        children[new_worst] = pop[old_best]
+        fchildren[new_worst] = fpop[old_best]
+        pop, fpop = children, fchildren
+
+        best = np.argmin(fpop)
+        if fbest[-1] - fpop[best] > tau_f:
+            stall = 0
+        else:
+            stall += 1
+        guesses.append(pop[best].copy())
+        fbest.append(fpop[best])
+        iters += 1
+
+    output = {
+        'xopt': guesses[-1],
+        'fopt': fbest[-1],
+        'guesses': np.array(guesses),
+        'fbest': np.array(fbest),
+        'iters': iters,
+        'success': iters < max_iter
+    }
+    return attach_summary(f, output)
+
+
+def particle_swarm(f, lb, ub, swarm_size=40, max_iter=200, inertia=0.7, c_cog=1.5, c_soc=1.5,
+                   max_vel=0.5, tau_f=1e-6, stall_iter=30, vectorized=False, seed=None):
+    """
+    Particle swarm optimization for finding the minimum of a function.
+
+    Args:
+      f: The function to minimize.
+      lb: lower bounds of the design variables.
+      ub: upper bounds of the design variables.
+      swarm_size: number of particles in the swarm.
+      max_iter: The maximum number of iterations to run the algorithm.
+      inertia: weight of the previous velocity.
+      c_cog: weight of the pull towards each particle's own best point.
+      c_soc: weight of the pull towards the swarm's best point.
+      max_vel: maximum velocity as a fraction of (ub - lb).
+      tau_f: tolerance for change in the best f
+      stall_iter: stop when the best f has not improved by tau_f for this many iterations.
+      vectorized: evaluate the swarm with a single call f(swarm.T), see eval_population.
+      seed: seed for the random number generator.
+
+    Returns:
+      An output dictionary with the optimum, the best point of every iteration and the iterations taken.
+    """
+    rng = np.random.default_rng(seed)
+    lb = np.asarray(lb, dtype=float)
+    ub = np.asarray(ub, dtype=float)
+    n = len(lb)
+    vel_max = max_vel * (ub - lb)
+
+    x = lb + rng.random((swarm_size, n)) * (ub - lb)
+    vel = (2*rng.random((swarm_size, n)) - 1) * vel_max
+    fx = eval_population(f, x, vectorized)
+
+    # best point seen by each particle and by the whole swarm
+    x_self = x.copy()
+    f_self = fx.copy()
+    best = np.argmin(f_self)
+    guesses = [x_self[best].copy()]
+    fbest = [f_self[best]]
+    iters = 0
+    stall = 0
+    while iters < max_iter and stall < stall_iter:
+        r1 = rng.random((swarm_size, n))
+        r2 = rng.random((swarm_size, n))
+        vel = inertia*vel + c_cog*r1*(x_self - x) + c_soc*r2*(x_self[best] - x)
+        vel = np.clip(vel, -vel_max, vel_max)
+        x = np.clip(x + vel, lb, ub)
+
+        # the whole swarm is evaluated as one batch
+        fx = eval_population(f, x, vectorized)
+
+        improved = fx < f_self
+        x_self[improved] = x[improved]
+        f_self[improved] = fx[improved]
+
+        best = np.argmin(f_self)
+        if fbest[-1] - f_self[best] > tau_f:
+            stall = 0
+        else:
+            stall += 1
+        guesses.append(x_self[best].copy())
+        fbest.append(f_self[best])
+        iters += 1
+
+    output = {
+        'xopt': guesses[-1],
+        'fopt': fbest[-1],
+        'guesses': np.array(guesses),
+        'fbest': np.array(fbest),
+        'iters': iters,
+        'success': iters < max_iter
+    }
+    return attach_summary(f, output)
+
+
+def potentially_optimal(d, fmin_d, fmin, eps):
+    """
+    Find the rectangle sizes that hold a potentially optimal rectangle.
+
+    Args:
+      d: ndarray of the distinct rectangle sizes (half diagonals), sorted in increasing order.
+      fmin_d: ndarray of the lowest f among the rectangles of each size.
+      fmin: lowest f found so far.
+      eps: minimum relative improvement over fmin a rectangle has to promise.
+
+    Returns:
+      ndarray of the indices into d of the potentially optimal sizes.
+    """
+    selected = []
+    for j in range(len(d)):
+        # range of lipschitz constants for which j lies on the lower right hull
+        k_low = np.max((fmin_d[j] - fmin_d[:j]) / (d[j] - d[:j]), initial=0)
+        k_up = np.min((fmin_d[j+1:] - fmin_d[j]) / (d[j+1:] - d[j]), initial=np.inf)
+        if k_low > k_up:
+            continue
+        # the rectangle must also promise a nontrivial improvement over fmin
+        if np.isfinite(k_up) and fmin_d[j] - k_up * d[j] > fmin - eps * abs(fmin):
+            continue
+        selected.append(j)
+    return np.array(selected, dtype=int)
+
+
+def direct(f, lb, ub, max_iter=100, max_fev=10000, eps=1e-4, tau_x=1e-10, vectorized=False):
+    """
+    DIRECT (DIviding RECTangles) algorithm for finding the global minimum of a bound constrained function.
+
+    The design space is scaled to the unit hypercube. Every rectangle has sides of length 3^-k,
+    and since the longest sides are always divided first, all rectangles with the same total number of
+    divisions have the same size. The rectangles are kept in a heap per size, so finding the potentially
+    optimal ones only needs the best rectangle of each size and not a pass over all of them.
+
+    Args:
+      f: The function to minimize.
+      lb: lower bounds of the design variables.
+      ub: upper bounds of the design variables.
+      max_iter: The maximum number of iterations to run the algorithm.
+      max_fev: The maximum number of function evaluations, checked at the start of every iteration.
+      eps: minimum relative improvement over the best f a rectangle has to promise to be divided.
+      tau_x: stop when the rectangle holding the best point is smaller than this (in scaled coordinates).
+      vectorized: evaluate the new centers with a single call f(X.T), see eval_population.
+
+    Returns:
+      An output dictionary with the optimum, the best point of every iteration, the rectangles
+      and the iterations taken.
+    """
+    lb = np.asarray(lb, dtype=float)
+    ub = np.asarray(ub, dtype=float)
+    n = len(lb)
+
+    def scaled(c):
+        return lb + c * (ub - lb)
+
+    # every rectangle is a center in the unit hypercube, its f and the division level of each side
+    centers = [np.full(n, 0.5)]
+    levels = [np.zeros(n, dtype=int)]
+    fx = [eval_population(f, scaled(centers[0])[None, :], vectorized)[0]]
+    fev = 1
+    # total divisions -> heap of (f, rectangle index)
+    buckets = {0: [(fx[0], 0)]}
+
+    def size(k):
+        # half diagonal of a rectangle with side levels k
+        return 0.5 * np.sqrt(np.sum(3.0**(-2*k)))
+
+    best = 0
+    guesses = [scaled(centers[best])]
+    fbest = [fx[best]]
+    iters = 0
+    while iters < max_iter and fev < max_fev and size(levels[best]) > tau_x:
+        keys = sorted(buckets, reverse=True)
+        d = np.array([size(levels[buckets[key][0][1]]) for key in keys])
+        fmin_d = np.array([buckets[key][0][0] for key in keys])
+        selected = [heapq.heappop(buckets[keys[j]])[1]
+                    for j in potentially_optimal(d, fmin_d, fx[best], eps)]
+
+        # sample along the longest sides of every selected rectangle
+        samples = []
+        for rect in selected:
+            k = levels[rect]
+            dims = np.flatnonzero(k == np.min(k))
+            delta = 3.0**(-(np.min(k) + 1))
+            for i in dims:
+                for sign in (1, -1):
+                    c = centers[rect].copy()
+                    c[i] += sign * delta
+                    samples.append((rect, i, c))
+
+        # all the new centers of this iteration are evaluated as one batch
+        fsamples = eval_population(
+            f, scaled(np.array([c for _, _, c in samples])), vectorized)
+        fev += len(samples)
+
+        s = 0
+        for rect in selected:
+            k = levels[rect]
+            ndims = np.count_nonzero(k == np.min(k))
+            rect_samples = samples[s:s + 2*ndims]
+            rect_f = fsamples[s:s + 2*ndims]
+            s += 2*ndims
+
+            # divide along the dimension with the best sample first, so it ends up in the biggest rectangle
+            w = np.minimum(rect_f[0::2], rect_f[1::2])
+            k = k.copy()
+            for order in np.argsort(w):
+                i = rect_samples[2*order][1]
+                k[i] += 1
+                for sample in (2*order, 2*order + 1):
+                    centers.append(rect_samples[sample][2])
+                    levels.append(k.copy())
+                    fx.append(rect_f[sample])
+                    heapq.heappush(buckets.setdefault(
+                        np.sum(k), []), (fx[-1], len(fx) - 1))
+            levels[rect] = k
+            heapq.heappush(buckets.setdefault(np.sum(k), []), (fx[rect], rect))
+
+        # drop sizes that have been emptied
+        buckets = {key: heap for key, heap in buckets.items() if heap}
+
+        best = int(np.argmin(fx))
+        guesses.append(scaled(centers[best]))
+        fbest.append(fx[best])
+        iters += 1
+
+    output = {
+        'xopt': guesses[-1],
+        'fopt': fbest[-1],
+        'guesses': np.array(guesses),
+        'fbest': np.array(fbest),
+        'centers': scaled(np.array(centers)),
+        'iters': iters,
+        'success': size(levels[best]) <= tau_x
+    }
+    return attach_summary(f, output)
 
 
 def plot_nm(f, simplex_list, title):
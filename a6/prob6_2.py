@@ -4,7 +4,7 @@ import numpy as np
 import scipy.optimize as opt
 
 import functions as fn
-from gradfree import nelder_mead, plot_nm, plot_nm_bfgs
+from gradfree import nelder_mead, genetic_algorithm, particle_swarm, plot_nm, plot_nm_bfgs
 
 
 if __name__ == "__main__":
@@ -162,3 +162,21 @@ if __name__ == "__main__":
         f"NM\t{out['success']}\t{wrapped_f.get_fev()}\t{' '.join(f'{x: .5e}' for x in xopt.x)}\t{xopt.fx:.5e}")
     print(
         f"BFGS\t{res.status==0}\t{res.nfev+res.njev}\t{' '.join(f'{x: .5e}' for x in res.x)}\t{res.fun:.5e}")
+
+    # population based methods on the multimodal versions of the bean, both are vectorized over points
+    lb = [-3, -3]
+    ub = [3, 3]
+    print(f"\nGA and PSO optimum with noise and checkerboard steps")
+    print("case\t\tGA fev\tGA x*\t\t\t\tGA fx*\t\tPSO fev\tPSO x*\t\t\t\tPSO fx*")
+    np.set_printoptions(precision=8, sign=' ', suppress=True)
+    cases = {
+        'noise 1e-3': fn.BeanNoisyPredictable(1e-3).f,
+        'step 1': lambda x: fn.bean_check_f(x, 1),
+    }
+    for case, case_f in cases.items():
+        wrapped_f_ga = fn.FevWrapper(case_f)
+        out_ga = genetic_algorithm(wrapped_f_ga, lb, ub, vectorized=True, seed=0)
+        wrapped_f_pso = fn.FevWrapper(case_f)
+        out_pso = particle_swarm(wrapped_f_pso, lb, ub, vectorized=True, seed=0)
+        print(
+            f"{case}\t{wrapped_f_ga.get_fev()}\t{out_ga['xopt']}\t{out_ga['fopt']: .8f}\t{wrapped_f_pso.get_fev()}\t{out_pso['xopt']}\t{out_pso['fopt']: .8f}")
@@ -5,12 +5,12 @@ import numpy as np
 import scipy.optimize as opt
 
 import functions as fn
-from gradfree import nelder_mead
+from gradfree import nelder_mead, direct
 
 if __name__ == "__main__":
     # 6.3
     print(f"6.3) Optimums")
-    print("dims\tmy NM fev\tNM fx*\t\tScipy NM fev\tScipy NM fx*\tBFGS FD fev\tBFGS FD fx*\tBFGS AG f+jev\tBFGS AG fx*")
+    print("dims\tmy NM fev\tNM fx*\t\tScipy NM fev\tScipy NM fx*\tBFGS FD fev\tBFGS FD fx*\tBFGS AG f+jev\tBFGS AG fx*\tDIRECT fev\tDIRECT fx*")
     # dims = [2, 4, 8, 16, 32, 64, 128]
     dims = [2, 4, 8, 16, 32, 64]
     # dims = [2, 4, 8, 16]
@@ -20,18 +20,22 @@ if __name__ == "__main__":
         'scipy nm x': [],
         'bfgs fd x': [],
         'bfgs ag x': [],
+        'direct x': [],
         'nm fx': [],
         'scipy nm fx': [],
         'bfgs fd fx': [],
         'bfgs ag fx': [],
+        'direct fx': [],
         'nm fev': [],
         'scipy nm fev': [],
         'bfgs fd fev': [],
         'bfgs ag fev': [],
+        'direct fev': [],
         'nm conv': [],
         'scipy nm conv': [],
         'bfgs fd conv': [],
         'bfgs ag conv': [],
+        'direct conv': [],
     }
 
     for dim in dims:
@@ -72,14 +76,25 @@ if __name__ == "__main__":
             res_sp_bfgs_ag.nfev + res_sp_bfgs_ag.njev)
         print_dict['bfgs ag conv'].append(res_sp_bfgs_ag.status == 0)
 
+        # DIRECT, bounds around the optimum and the fev my NM just took as its budget,
+        # checked once per iteration so it overshoots by part of an iteration
+        wrapped_f_direct = fn.FevWrapper(fn.rosenbrock_nd_f)
+        out_direct = direct(wrapped_f_direct, -5*np.ones(dim), 5*np.ones(dim),
+                            max_iter=10000, max_fev=wrapped_f.get_fev(), vectorized=True)
+        print_dict['direct x'].append(np.linalg.norm(out_direct['xopt']-xopt))
+        print_dict['direct fx'].append(out_direct['fopt'])
+        print_dict['direct fev'].append(wrapped_f_direct.get_fev())
+        print_dict['direct conv'].append(out_direct['success'])
+
         print(
-            f"{dim}\t{wrapped_f.get_fev()}\t\t{out['simplex'][-1][0].fx: .5e}\t{res_sp_nm.nfev}\t\t{res_sp_nm.fun: .5e}\t{res_sp_bfgs_fd.nfev}\t\t{res_sp_bfgs_fd.fun: .5e}\t{res_sp_bfgs_ag.nfev+res_sp_bfgs_ag.njev}\t\t{res_sp_bfgs_ag.fun: .5e}")
+            f"{dim}\t{wrapped_f.get_fev()}\t\t{out['simplex'][-1][0].fx: .5e}\t{res_sp_nm.nfev}\t\t{res_sp_nm.fun: .5e}\t{res_sp_bfgs_fd.nfev}\t\t{res_sp_bfgs_fd.fun: .5e}\t{res_sp_bfgs_ag.nfev+res_sp_bfgs_ag.njev}\t\t{res_sp_bfgs_ag.fun: .5e}\t{wrapped_f_direct.get_fev()}\t\t{out_direct['fopt']: .5e}")
 
     # plot all the fevs vs dims
     plt.plot(dims, print_dict['nm fev'], label="My Nelder-Mead")
     plt.plot(dims, print_dict['scipy nm fev'], label="Scipy Nelder-Mead")
     plt.plot(dims, print_dict['bfgs fd fev'], label="BFGS Finite Difference")
     plt.plot(dims, print_dict['bfgs ag fev'], label="BFGS Analytical Gradient")
+    plt.plot(dims, print_dict['direct fev'], label="DIRECT")
     plt.grid(visible=True, which='both', axis='both')
     plt.xlabel("Dimensions")
     plt.ylabel("Function Evaluations")
@@ -0,0 +1,144 @@
+import numpy as np
+from time import perf_counter
+
+# instrumentation shared by the assignments, each one puts this folder on its path
+
+
+class FevWrapper:
+    """
+    Wraps a function to count its evaluations and time every call.
+
+    A batch f(X.T) with X of shape (k, n) counts as k evaluations, so population based methods
+    and point by point methods can be compared on the same fev.
+
+    Parameters:
+    - f (callable): The function to wrap.
+    - memoize (bool, optional): Cache single point calls and return the cached value when the same x comes again.
+      Cache hits are not counted as evaluations. Defaults to False.
+    - max_fev (int, optional): Raise a RuntimeError once this many evaluations are reached. Defaults to None.
+    """
+
+    def __init__(self, f, memoize=False, max_fev=None):
+        self._f = f
+        self._fev = 0
+        self._memoize = memoize
+        self._max_fev = max_fev
+        self._cache = {}
+        self._hits = 0
+        # points and wall time of every call that reached f
+        self._points = []
+        self._times = []
+
+    def __call__(self, x):
+        points = int(np.prod(np.shape(x)[1:]))
+        key = None
+        if self._memoize and points == 1:
+            key = np.asarray(x, dtype=float).tobytes()
+            if key in self._cache:
+                self._hits += 1
+                return self._cache[key]
+
+        self._fev += points
+        if self._max_fev is not None and self._fev > self._max_fev:
+            raise RuntimeError(
+                f'Reached the function evaluation limit of {self._max_fev}.')
+
+        start = perf_counter()
+        fx = self._f(x)
+        self._times.append(perf_counter() - start)
+        self._points.append(points)
+
+        if key is not None:
+            self._cache[key] = fx
+        return fx
+
+    def get_fev(self):
+        """
+        Returns the number of function evaluations made, counting points in a batch.
+        """
+        return self._fev
+
+    def get_calls(self):
+        """
+        Returns the number of calls that reached the function, a batch is a single call.
+        """
+        return len(self._times)
+
+    def get_hits(self):
+        """
+        Returns the number of calls answered from the cache.
+        """
+        return self._hits
+
+    def summary(self, iters=None, bins=10):
+        """
+        Summarize the evaluations made so far.
+
+        Parameters:
+        - iters (int, optional): The iterations the optimizer took, to get the evaluations per iteration.
+        - bins (int, optional): The number of bins in the latency histogram. Defaults to 10.
+
+        Returns:
+        - dict: fev, calls, cache hits, total time, p50/p95 latency per call and per point,
+          the latency histogram as (counts, bin edges) and the evaluations per iteration.
+        """
+        times = np.array(self._times)
+        per_point = times / np.maximum(self._points, 1)
+        summary = {
+            'fev': self._fev,
+            'calls': len(times),
+            'hits': self._hits,
+            'time': np.sum(times),
+            'p50': np.percentile(times, 50) if len(times) else np.nan,
+            'p95': np.percentile(times, 95) if len(times) else np.nan,
+            'p50_point': np.percentile(per_point, 50) if len(times) else np.nan,
+            'p95_point': np.percentile(per_point, 95) if len(times) else np.nan,
+            'hist': np.histogram(times, bins=bins) if len(times) else None,
+        }
+        if iters:
+            summary['fev_per_iter'] = self._fev / iters
+        return summary
+
+
+class ConvergenceRate:
+    """
+    Streaming estimate of the order p and constant gamma in e_k+1 = gamma e_k^p from the last
+    three errors, so a long run never has to keep its iterates to know how it converged.
+    It is a callback, call it with each new error (step size, gradient norm, simplex size,
+    whatever the solver converges on). A batch of independent solves passes an array of errors and the
+    indices of the problems they belong to, every problem is tracked on its own.
+    Errors of exactly zero carry no rate information and are skipped.
+
+    Parameters:
+    - size (int, optional): number of independent problems, None for a single scalar solve.
+    """
+
+    def __init__(self, size=None):
+        self.scalar = size is None
+        n = 1 if size is None else size
+        # last three errors of every problem, newest last
+        self.errors = np.full((3, n), np.nan)
+
+    def __call__(self, error, index=None):
+        error = np.atleast_1d(np.asarray(error, dtype=float))
+        index = np.arange(self.errors.shape[1]) if index is None else np.atleast_1d(index)
+        keep = error > 0
+        index = index[keep]
+        self.errors[:, index] = np.vstack([self.errors[1:, index], error[keep]])
+
+    def _result(self, value):
+        value[~np.isfinite(value)] = np.nan
+        return value[0] if self.scalar else value
+
+    @property
+    def p(self):
+        e0, e1, e2 = self.errors
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._result(np.log(e2/e1)/np.log(e1/e0))
+
+    @property
+    def gamma(self):
+        e0, e1, e2 = self.errors
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            p = np.log(e2/e1)/np.log(e1/e0)
+            return self._result(e2/e1**p)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+import numpy as np
+
+from instrument import ConvergenceRate
+
+# scalar root finders that work on whole arrays of independent problems at once
+# f(x, *args) must work elementwise, args are broadcast to the shape of x and sliced along with
+# it so only the elements that are still iterating get evaluated
+# every solver returns x and an output dict with
+# - iters: iterations each element took
+# - converged: whether each element met the tolerance
+# - rate: estimated order of convergence from the last three step sizes above roundoff, nan with
+#   fewer steps, only meaningful once the solver has settled into one kind of step
+# - history: every iterate, one row per iteration, only if history=True
+# callback, if given, is called after every iteration with the step sizes above roundoff and the
+# flat indices of their elements, a ConvergenceRate(x.size) fits
+
+
+class _Batch:
+    # bookkeeping shared by the solvers, the active indices, step sizes for the rate and history
+    def __init__(self, x, args, history, shape=(), callback=None):
+        self.shape = np.broadcast_shapes(np.shape(x), shape, *[np.shape(arg) for arg in args])
+        self.x = np.array(np.broadcast_to(x, self.shape), dtype=float).ravel()
+        self.args = [np.broadcast_to(arg, self.shape).ravel() for arg in args]
+        self.active = np.arange(self.x.size)
+        self.iters = np.zeros(self.x.size, dtype=int)
+        self.converged = np.zeros(self.x.size, dtype=bool)
+        self.rate = ConvergenceRate(self.x.size)
+        self.callback = callback
+        self.history = [self.x.copy()] if history else None
+
+    def active_args(self):
+        return [arg[self.active] for arg in self.args]
+
+    def step(self, x_new):
+        step = np.abs(x_new - self.x[self.active])
+        self.x[self.active] = x_new
+        self.iters[self.active] += 1
+        # steps at roundoff level say nothing about the rate
+        real = step > 1e3*np.finfo(float).eps*np.maximum(1, np.abs(x_new))
+        self.rate(step[real], self.active[real])
+        if self.callback is not None:
+            self.callback(step[real], self.active[real])
+        if self.history is not None:
+            self.history.append(self.x.copy())
+        return step
+
+    def finish(self, done, converged=None):
+        self.converged[self.active[done if converged is None else converged]] = True
+        self.active = self.active[~done]
+
+    def check_bracket(self, lo, hi, f_lo, f_hi):
+        # an endpoint that is already a root is the answer, and a bracket without a sign change
+        # has no root to find, it stops at nan and is not converged
+        at_lo, at_hi, bad = f_lo == 0, f_hi == 0, f_lo*f_hi > 0
+        self.x = np.where(at_lo, lo, np.where(at_hi, hi, np.where(bad, np.nan, self.x)))
+        self.finish(at_lo | at_hi | bad, converged=at_lo | at_hi)
+
+    def output(self):
+        output = {
+            'iters': self.iters.reshape(self.shape),
+            'converged': self.converged.reshape(self.shape),
+            'rate': self.rate.p.reshape(self.shape),
+        }
+        if self.history is not None:
+            output['history'] = np.array(self.history).reshape(-1, *self.shape)
+        x = self.x.reshape(self.shape)
+        return (x[()] if x.ndim == 0 else x), output
+
+
+def newton(f, df, x0, args=(), xtol=1e-12, ftol=0, max_iters=50, d2f=None, history=False,
+           callback=None):
+    """
+    Newton's method, an element stops once its step is below xtol or its residual below ftol.
+    With the second derivative d2f it takes halley's third order steps instead.
+    """
+    batch = _Batch(x0, args, history, callback=callback)
+    for it in range(max_iters + 1):
+        x = batch.x[batch.active]
+        args_a = batch.active_args()
+        fx = f(x, *args_a)
+        # elements already within ftol stop without taking another step
+        done = np.abs(fx) <= ftol
+        batch.finish(done)
+        if batch.active.size == 0 or it == max_iters:
+            break
+        x, fx, args_a = x[~done], fx[~done], [arg[~done] for arg in args_a]
+        dfx = df(x, *args_a)
+        if d2f is not None:
+            dfx = dfx - fx*d2f(x, *args_a)/(2*dfx)
+        step = batch.step(x - fx/dfx)
+        batch.finish(step <= xtol)
+        if batch.active.size == 0:
+            break
+    return batch.output()
+
+
+def newton_bisect(f, df, lo, hi, args=(), x0=None, xtol=1e-12, max_iters=100, history=False,
+                  callback=None):
+    """
+    Newton's method kept inside a bracket [lo, hi] with a sign change, an element bisects
+    whenever its newton step leaves the bracket or would not halve the previous step.
+    Converges wherever bisection does, at newton's rate once close. An element whose bracket
+    has no sign change is returned as nan and not converged.
+    """
+    lo, hi = np.broadcast_arrays(np.array(lo, dtype=float), np.array(hi, dtype=float))
+    batch = _Batch((lo + hi)/2 if x0 is None else x0, args, history, lo.shape, callback)
+    lo = np.array(np.broadcast_to(lo, batch.shape)).ravel()
+    hi = np.array(np.broadcast_to(hi, batch.shape)).ravel()
+    f_lo = f(lo, *batch.args)
+    batch.check_bracket(lo, hi, f_lo, f(hi, *batch.args))
+    step_prev = np.abs(hi - lo)
+    for it in range(max_iters):
+        active = batch.active
+        x = batch.x[active]
+        args_a = batch.active_args()
+        fx = f(x, *args_a)
+        dfx = df(x, *args_a)
+        # shrink the bracket to the side that still has the sign change
+        same = np.sign(fx) == np.sign(f_lo[active])
+        lo[active] = np.where(same, x, lo[active])
+        f_lo[active] = np.where(same, fx, f_lo[active])
+        hi[active] = np.where(same, hi[active], x)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_new = x - fx/dfx
+        # a step that rounds onto the bracket end it started from is converged, not outside
+        bisect = ~((x_new - lo[active])*(x_new - hi[active]) <= 0) | \
+            (np.abs(x_new - x) > step_prev[active]/2)
+        x_new = np.where(bisect, (lo[active] + hi[active])/2, x_new)
+        # an exact root is on the bracket boundary and would be bisected away
+        x_new = np.where(fx == 0, x, x_new)
+        step = batch.step(x_new)
+        step_prev[active] = step
+        batch.finish((fx == 0) | (step <= xtol))
+        if batch.active.size == 0:
+            break
+    return batch.output()
+
+
+def brent(f, lo, hi, args=(), xtol=1e-12, rtol=4*np.finfo(float).eps, max_iters=100, history=False,
+          callback=None):
+    """
+    Brent's method on a bracket [lo, hi] with a sign change, following scipy's brentq:
+    inverse quadratic interpolation or secant steps while they shrink the bracket fast enough,
+    bisection otherwise. Needs no derivative. An element whose bracket has no sign change is
+    returned as nan and not converged.
+    """
+    lo, hi = np.broadcast_arrays(np.array(lo, dtype=float), np.array(hi, dtype=float))
+    batch = _Batch(hi, args, history, lo.shape, callback)
+    x_pre = np.array(np.broadcast_to(lo, batch.shape)).ravel()
+    f_pre = f(x_pre, *batch.args)
+    f_cur = f(batch.x, *batch.args)
+    batch.check_bracket(x_pre, batch.x, f_pre, f_cur)
+    x_blk = x_pre.copy()
+    f_blk = f_pre.copy()
+    s_pre = np.zeros_like(x_pre)
+    s_cur = np.zeros_like(x_pre)
+    for it in range(max_iters + 1):
+        a = batch.active
+        x_cur = batch.x[a]
+        xp, fp, fc = x_pre[a], f_pre[a], f_cur[a]
+        xb, fb, sp, sc = x_blk[a], f_blk[a], s_pre[a], s_cur[a]
+
+        # the blk point keeps the bracket with the current one
+        flip = fp*fc < 0
+        xb = np.where(flip, xp, xb)
+        fb = np.where(flip, fp, fb)
+        sp = np.where(flip, x_cur - xp, sp)
+        sc = np.where(flip, x_cur - xp, sc)
+        # and the current point is the better one
+        swap = np.abs(fb) < np.abs(fc)
+        xp, x_cur, xb = np.where(swap, x_cur, xp), np.where(swap, xb, x_cur), np.where(swap, x_cur, xb)
+        fp, fc, fb = np.where(swap, fc, fp), np.where(swap, fb, fc), np.where(swap, fc, fb)
+
+        delta = (xtol + rtol*np.abs(x_cur))/2
+        s_bis = (xb - x_cur)/2
+        done = (fc == 0) | (np.abs(s_bis) < delta)
+        if it == max_iters:
+            done[:] = False
+        batch.x[a] = x_cur
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            secant = -fc*(x_cur - xp)/(fc - fp)
+            d_pre = (fp - fc)/(xp - x_cur)
+            d_blk = (fb - fc)/(xb - x_cur)
+            inv_quad = -fc*(fb*d_blk - fp*d_pre)/(d_blk*d_pre*(fb - fp))
+        s_try = np.where(xp == xb, secant, inv_quad)
+        interp = (np.abs(sp) > delta) & (np.abs(fc) < np.abs(fp))
+        good = interp & (2*np.abs(s_try) < np.minimum(np.abs(sp), 3*np.abs(s_bis) - delta))
+        sp = np.where(good, sc, s_bis)
+        sc = np.where(good, s_try, s_bis)
+
+        x_pre[a], f_pre[a], x_blk[a], f_blk[a], s_pre[a], s_cur[a] = x_cur, fc, xb, fb, sp, sc
+        batch.finish(done)
+        if batch.active.size == 0 or it == max_iters:
+            break
+        keep = ~done
+        x_cur, sc, delta, s_bis = x_cur[keep], sc[keep], delta[keep], s_bis[keep]
+        x_new = x_cur + np.where(np.abs(sc) > delta, sc, np.where(s_bis > 0, delta, -delta))
+        batch.step(x_new)
+        f_cur[batch.active] = f(x_new, *batch.active_args())
+    return batch.output()
+
+
+if __name__ == "__main__":
+    # kepler's equation for a spread of mean anomalies, e = 0.9
+    def kepler(E, M, e): return E - e*np.sin(E) - M
+    def dkepler(E, M, e): return 1 - e*np.cos(E)
+    def d2kepler(E, M, e): return e*np.sin(E)
+
+    M = np.linspace(0.1, 2*np.pi - 0.1, 7)
+    ecc = 0.9
+    for name, (E, output) in [
+            ("newton", newton(kepler, dkepler, np.pi, args=(M, ecc))),
+            ("halley", newton(kepler, dkepler, np.pi, args=(M, ecc), d2f=d2kepler)),
+            ("newton-bisection", newton_bisect(kepler, dkepler, 0, 2*np.pi, args=(M, ecc))),
+            ("brent", brent(kepler, 0, 2*np.pi, args=(M, ecc)))]:
+        print(f"{name}: converged: {np.all(output['converged'])}, max residual: {np.max(np.abs(kepler(E, M, ecc))):.1e}, "
+              f"iterations: {output['iters']}, rates: {np.round(output['rate'], 2)}")
+
+    # the same rates streamed through a callback, with the constant gamma as well
+    rate = ConvergenceRate(M.size)
+    newton(kepler, dkepler, np.pi, args=(M, ecc), callback=rate)
+    print(f"newton through a callback: p: {np.round(rate.p, 2)}, gamma: {np.round(rate.gamma, 2)}")